@@ -0,0 +1,38 @@
+"""
+Configurazione per il serving multi-worker:
+
+    gunicorn -c app/gunicorn_conf.py app.main:app
+"""
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.getenv('PORT', '3000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Un worker per CPU salvo override (WEB_CONCURRENCY è la convenzione di gunicorn/Heroku)
+workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+# L'app viene importata una sola volta nel master e condivisa copy-on-write dai worker
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Metriche Prometheus condivise tra i worker: la cartella va svuotata
+# prima che il master importi l'app (il config è caricato prima del preload)
+_metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if _metrics_dir:
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+def post_fork(server, worker):
+    from app.database import engine, async_engine
+    from app.services.metrics import mark_boot_start
+
+    mark_boot_start()
+    # Le connessioni aperte nel master non vanno condivise con i worker
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
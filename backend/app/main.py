@@ -1,29 +1,84 @@
-from fastapi import FastAPI
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes.quiz import router as quiz_router
 from app.routes.auth import router as auth_router
 from app.routes.upload import router as upload_router
-from app.database import Base, engine
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Quiz App with Auth")
-
-# CORS configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for online deployment
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Include routers with /api prefix
-app.include_router(quiz_router, prefix="/api")
-app.include_router(auth_router, prefix="/api")
-app.include_router(upload_router, prefix="/api")
-
-@app.get("/")
-def read_root():
-    return {"message": "Quiz App API"}
+from app.database import engine, async_engine
+from app.services.auth import hashing_pool
+from app.services.geo import close_geo_resolver
+from app.services.parse_pool import parse_pool
+from app.services.metrics import MetricsMiddleware, instrument_engine, render_metrics, observe_boot
+from app.services.profiler import ProfilerMiddleware
+from app.services.compression import CompressionMiddleware
+from app.services.search import SEARCH_BACKEND, SEARCH_WARMUP, warm_search_index
+
+logger = logging.getLogger(__name__)
+
+# Con AUTO_MIGRATE=1 lo schema viene creato all'avvio (comodo in locale, un solo worker)
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if AUTO_MIGRATE:
+        from app.migrate import migrate
+        migrate()
+    if SEARCH_BACKEND == "memory" and SEARCH_WARMUP:
+        # Indice di ricerca caricato in background: il worker accetta richieste subito
+        threading.Thread(target=warm_search_index, name="search-warmup", daemon=True).start()
+    logger.info("Worker %s ready in %.3fs", os.getpid(), observe_boot())
+    yield
+    # Chiusura ordinata di pool e client condivisi
+    await close_geo_resolver()
+    await async_engine.dispose()
+    engine.dispose()
+    hashing_pool.shutdown()
+    parse_pool.shutdown()
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="Quiz App with Auth", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+    # Query e tempo DB per richiesta (sia engine sync che async)
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+
+    # Profilazione opt-in per admin (header X-Profile: 1)
+    app.add_middleware(ProfilerMiddleware)
+
+    # CORS configuration
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allow all origins for online deployment
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Compressione brotli/gzip negoziata, sopra soglia COMPRESS_MIN_SIZE
+    app.add_middleware(CompressionMiddleware)
+
+    # Metriche per route: aggiunto per ultimo così misura anche gli altri middleware
+    app.add_middleware(MetricsMiddleware, fastapi_app=app)
+
+    # Include routers with /api prefix
+    app.include_router(quiz_router, prefix="/api")
+    app.include_router(auth_router, prefix="/api")
+    app.include_router(upload_router, prefix="/api")
+
+    @app.get("/")
+    def read_root():
+        return {"message": "Quiz App API"}
+
+    # Metriche in formato Prometheus
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        body, content_type = render_metrics()
+        return Response(content=body, media_type=content_type)
+
+    return app
+
+app = create_app()
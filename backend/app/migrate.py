@@ -0,0 +1,25 @@
+"""
+Gestione dello schema, separata dall'avvio dell'app.
+
+    python -m app.migrate
+"""
+import logging
+from app.database import Base, engine
+# Registra tutti i modelli su Base.metadata
+from app.models import user, library, geo  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+def migrate():
+    # Create database tables
+    Base.metadata.create_all(bind=engine)
+
+    # create_all non aggiunge indici a tabelle già esistenti
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate()
+    logger.info("Schema up to date")
@@ -0,0 +1,9 @@
+from sqlalchemy import Column, String, DateTime
+from app.database import Base, utc_now
+
+class IpLocation(Base):
+    __tablename__ = "ip_locations"
+
+    ip = Column(String, primary_key=True)
+    location = Column(String, nullable=True)  # "città, regione, paese"
+    resolved_at = Column(DateTime, default=utc_now)
@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Index, UniqueConstraint, func, literal_column
+from datetime import datetime, timezone
+from app.database import Base
+
+class QuizFile(Base):
+    __tablename__ = "quiz_files"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True)  # SHA-256 del contenuto
+    filename = Column(String)  # Nome del primo upload
+    content = Column(Text)  # Testo originale del file
+    questions = Column(JSON)  # Domande parsate, ordine originale, opzioni non mescolate
+    question_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class QuestionDocument(Base):
+    """
+    Testo indicizzabile di ogni domanda della libreria (domanda, opzioni, commento).
+    L'id cresce a ogni inserimento: l'indice in memoria di ogni worker si aggiorna
+    leggendo solo le righe con id maggiore dell'ultimo visto.
+    """
+    __tablename__ = "question_documents"
+
+    id = Column(Integer, primary_key=True)
+    quiz_file_id = Column(Integer, ForeignKey("quiz_files.id"), nullable=False)
+    question_id = Column(Integer, nullable=False)  # Numero dell'esercizio nel file
+    content = Column(Text)
+
+    __table_args__ = (
+        UniqueConstraint("quiz_file_id", "question_id", name="uq_question_documents_question"),
+        # Ricerca full-text lato database (SEARCH_BACKEND=postgres), solo su PostgreSQL
+        Index(
+            "ix_question_documents_tsv",
+            func.to_tsvector(literal_column("'italian'"), content),
+            postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
@@ -1,7 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, SmallInteger, String, Float, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
-from datetime import datetime, timezone
-from app.database import Base
+from app.database import Base, utc_now
 
 class User(Base):
     __tablename__ = "users"
@@ -12,12 +11,15 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
     last_login = Column(DateTime, nullable=True)
     last_ip = Column(String, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utc_now)
     failed_login_attempts = Column(Integer, default=0)
     last_failed_login = Column(DateTime, nullable=True)
     locked_until = Column(DateTime, nullable=True)
 
     quiz_stats = relationship("QuizStat", back_populates="user", cascade="all, delete-orphan")
+    stats_aggregate = relationship("UserStatsAggregate", uselist=False, cascade="all, delete-orphan")
+    best_attempts = relationship("QuizBestAttempt", cascade="all, delete-orphan")
+    question_stats = relationship("UserQuestionStat", cascade="all, delete-orphan")
 
 class QuizStat(Base):
     __tablename__ = "quiz_stats"
@@ -32,6 +34,73 @@ class QuizStat(Base):
     no_answers = Column(Integer)
     time_spent = Column(Integer)  # Secondi
     attempt_number = Column(Integer, default=1)  # Quale tentativo
-    completed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    completed_at = Column(DateTime, default=utc_now)
 
     user = relationship("User", back_populates="quiz_stats")
+    answers = relationship("QuestionAnswer", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # Storico paginato per utente (ORDER BY completed_at DESC, id DESC)
+        Index("ix_quiz_stats_user_completed", "user_id", "completed_at", "id"),
+        # Storico filtrato per quiz
+        Index("ix_quiz_stats_user_quiz_completed", "user_id", "quiz_name", "completed_at", "id"),
+    )
+
+class UserStatsAggregate(Base):
+    """Totali per utente aggiornati a ogni /quiz/submit (evita di sommare quiz_stats)"""
+    __tablename__ = "user_stats_aggregates"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_quizzes = Column(Integer, default=0)
+    total_score = Column(Float, default=0.0)
+    total_correct = Column(Integer, default=0)
+    total_wrong = Column(Integer, default=0)
+    total_unanswered = Column(Integer, default=0)
+    total_time_spent = Column(Integer, default=0)
+    last_activity = Column(DateTime, nullable=True)
+
+class QuizAttemptCounter(Base):
+    """Numero di tentativi per (utente, quiz): evita il COUNT su quiz_stats a ogni submit"""
+    __tablename__ = "quiz_attempt_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    quiz_name = Column(String, primary_key=True)
+    attempts = Column(Integer, default=0)
+
+class QuizBestAttempt(Base):
+    """Miglior tentativo per (utente, quiz): la classifica si legge da qui, non da quiz_stats"""
+    __tablename__ = "quiz_best_attempts"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    quiz_name = Column(String, primary_key=True)
+    stat_id = Column(Integer, ForeignKey("quiz_stats.id"))
+    score = Column(Float)  # Arrotondato a 2 decimali: i pari merito non dipendono dagli errori float
+    max_score = Column(Integer)
+    time_spent = Column(Integer)
+    completed_at = Column(DateTime)
+
+    __table_args__ = (
+        # Ordine di classifica: punteggio decrescente, tempo crescente, tentativo più vecchio
+        Index("ix_quiz_best_rank", "quiz_name", "score", "time_spent", "stat_id"),
+    )
+
+class QuestionAnswer(Base):
+    """Esito di ogni domanda di un tentativo (solo append, un insert bulk per submit)"""
+    __tablename__ = "question_answers"
+
+    stat_id = Column(Integer, ForeignKey("quiz_stats.id", ondelete="CASCADE"), primary_key=True)
+    question_id = Column(Integer, primary_key=True)  # Numero dell'esercizio nel file
+    quiz_file_id = Column(Integer, ForeignKey("quiz_files.id"))
+    outcome = Column(SmallInteger)  # 1 corretta, 0 non risposta, -1 sbagliata
+
+class UserQuestionStat(Base):
+    """Esiti cumulati per (utente, file, domanda): base dei quiz sulle domande più sbagliate"""
+    __tablename__ = "user_question_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    quiz_file_id = Column(Integer, ForeignKey("quiz_files.id"), primary_key=True)
+    question_id = Column(Integer, primary_key=True)
+    attempts = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+    wrong = Column(Integer, default=0)
+    blank = Column(Integer, default=0)
@@ -1,12 +1,33 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Header, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Header, Request, Response, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import func, select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from app.database import get_db
+from app.database import get_async_db, AsyncSessionLocal, utc_now
 from app.models.user import User, QuizStat
-from app.services.auth import hash_password, verify_password, create_access_token
+from app.services.auth import hash_password_async, verify_and_update_password, create_access_token, HashingBusyError
+from app.services.stats import get_user_aggregate
+from app.services.geo import get_locations
+from app.services.principal import Principal, load_principal
+from app.services.rate_limit import check_login_allowed, login_succeeded
+from app.services.metrics import LOGIN_RATE_LIMITED
+from app.utils.pagination import encode_cursor, decode_cursor
 from typing import Optional
+from datetime import datetime, timedelta
+import csv
+import io
+import ipaddress
+import orjson
+import os
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(prefix="/auth", tags=["Authentication"], default_response_class=ORJSONResponse)
+
+# Proxy (IP o reti CIDR, separati da virgola) di cui si accetta l'header X-Forwarded-For
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.getenv("TRUSTED_PROXIES", "").split(",")
+    if network.strip()
+]
 
 class UserRegister(BaseModel):
     username: str
@@ -40,11 +61,41 @@ class QuizHistory(BaseModel):
     time_spent: int
     completed_at: str
 
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+def client_ip(request: Request) -> Optional[str]:
+    """
+    IP del client per rate limit e statistiche. X-Forwarded-For è scritto dal client:
+    si legge solo se la connessione arriva da un proxy fidato (TRUSTED_PROXIES), e si
+    prende l'ultimo indirizzo non fidato, cioè quello aggiunto dal nostro proxy.
+    """
+    peer = request.client.host if request.client else None
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    if peer is None or not forwarded_for or not _is_trusted_proxy(peer):
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+def raise_hashing_busy():
+    raise HTTPException(
+        status_code=503,
+        detail="Server busy, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
 # Register
 @router.post("/register", response_model=TokenResponse)
-async def register(user_data: UserRegister, request: Request, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, request: Request, db: AsyncSession = Depends(get_async_db)):
     # Check if user exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
+    existing_user = await db.scalar(select(User).where(User.username == user_data.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
     
@@ -64,23 +115,27 @@ async def register(user_data: UserRegister, request: Request, db: Session = Depe
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
     
     # Check if this is the admin account
-    import os
     admin_username = os.getenv("ADMIN_USERNAME", "admin")
     is_admin = (user_data.username == admin_username)
     
     # Get IP address from request
-    ip_address = request.headers.get("X-Forwarded-For", request.client.host).split(",")[0].strip()
+    ip_address = client_ip(request)
+    
+    # Create user (bcrypt fuori dall'event loop)
+    try:
+        hashed_password = await hash_password_async(user_data.password)
+    except HashingBusyError:
+        raise_hashing_busy()
     
-    # Create user
     new_user = User(
         username=user_data.username,
-        hashed_password=hash_password(user_data.password),
+        hashed_password=hashed_password,
         is_admin=is_admin,
         last_ip=ip_address
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # Generate token
     access_token = create_access_token(data={"sub": new_user.username})
@@ -94,16 +149,27 @@ async def register(user_data: UserRegister, request: Request, db: Session = Depe
 
 # Login
 @router.post("/login", response_model=TokenResponse)
-async def login(user_data: UserLogin, request: Request, db: Session = Depends(get_db)):
-    from datetime import datetime, timezone, timedelta
-    
-    user = db.query(User).filter(User.username == user_data.username).first()
+async def login(user_data: UserLogin, request: Request, db: AsyncSession = Depends(get_async_db)):
+    # Limite in memoria per IP e username: i burst vengono respinti prima di database e bcrypt
+    ip_address = client_ip(request)
+    retry_after = await check_login_allowed(ip_address or "unknown", user_data.username)
+    if retry_after:
+        LOGIN_RATE_LIMITED.inc()
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many login attempts. Try again in {retry_after} seconds",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    user = await db.scalar(select(User).where(User.username == user_data.username))
     
-    # Check if user is locked due to brute force
+    # Check if user is locked due to brute force (blocco persistente, ultima difesa)
     if user and user.locked_until:
-        now = datetime.now(timezone.utc)
-        if now < user.locked_until:
-            remaining_seconds = int((user.locked_until - now).total_seconds())
+        # Colonna senza timezone: valori in UTC naive
+        now = utc_now()
+        locked_until = user.locked_until
+        if now < locked_until:
+            remaining_seconds = int((locked_until - now).total_seconds())
             raise HTTPException(
                 status_code=429,
                 detail=f"Account locked due to too many failed login attempts. Try again in {remaining_seconds} seconds"
@@ -112,36 +178,41 @@ async def login(user_data: UserLogin, request: Request, db: Session = Depends(ge
             # Unlock the account
             user.locked_until = None
             user.failed_login_attempts = 0
-            db.commit()
+            await db.commit()
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    password_ok, new_hash = False, None
+    if user:
+        try:
+            password_ok, new_hash = await verify_and_update_password(user_data.password, user.hashed_password)
+        except HashingBusyError:
+            raise_hashing_busy()
+    
+    if not password_ok:
         # Record failed login attempt
         if user:
             user.failed_login_attempts = (user.failed_login_attempts or 0) + 1
-            user.last_failed_login = datetime.now(timezone.utc)
+            user.last_failed_login = utc_now()
             
             # Lock account after 5 failed attempts for 30 minutes
             if user.failed_login_attempts >= 5:
-                user.locked_until = datetime.now(timezone.utc) + timedelta(minutes=30)
+                user.locked_until = utc_now() + timedelta(minutes=30)
             
-            db.commit()
+            await db.commit()
         
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Get client IP
-    client_ip = request.client.host if request.client else None
-    # Check for forwarded IP (if behind proxy)
-    forwarded_for = request.headers.get("X-Forwarded-For")
-    if forwarded_for:
-        client_ip = forwarded_for.split(",")[0].strip()
+    await login_succeeded(ip_address or "unknown", user.username)
     
     # Reset failed login attempts on successful login
     user.failed_login_attempts = 0
     user.last_failed_login = None
     user.locked_until = None
-    user.last_login = datetime.now(timezone.utc)
-    user.last_ip = client_ip
-    db.commit()
+    user.last_login = utc_now()
+    user.last_ip = ip_address
+    # Rehash trasparente se è cambiato il costo bcrypt
+    if new_hash:
+        user.hashed_password = new_hash
+    await db.commit()
     
     # Generate token
     access_token = create_access_token(data={"sub": user.username})
@@ -153,75 +224,72 @@ async def login(user_data: UserLogin, request: Request, db: Session = Depends(ge
         "is_admin": user.is_admin
     }
 
-# Get current user from token
-def get_current_user(token: str, db: Session = Depends(get_db)):
-    from fastapi import Header
+# Get current user from token (dipendenza riusabile: dopo il primo uso del token nessuna query)
+async def get_current_user(
+    authorization: str = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    token = authorization.replace("Bearer ", "") if authorization else None
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    from app.services.auth import verify_token
-    username = verify_token(token)
-    
-    if not username:
+    principal = await load_principal(token, db)
+    if principal is None:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    return user
+    return principal
 
 # Get user statistics
 @router.get("/stats", response_model=UserStats)
 async def get_stats(
-    authorization: str = Header(None),
-    db: Session = Depends(get_db)
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    token = authorization.replace("Bearer ", "") if authorization else None
-    user = get_current_user(token, db)
-    
-    stats = db.query(QuizStat).filter(QuizStat.user_id == user.id).all()
-    
-    if not stats:
-        return {
-            "username": user.username,
-            "total_quizzes": 0,
-            "average_score": 0.0,
-            "total_correct": 0,
-            "total_wrong": 0,
-            "total_unanswered": 0,
-            "total_time_spent": 0
-        }
-    
-    total_score = sum(s.score for s in stats)
-    total_correct = sum(s.correct_answers for s in stats)
-    total_wrong = sum(s.wrong_answers for s in stats)
-    total_unanswered = sum(s.no_answers for s in stats)
-    total_time = sum(s.time_spent for s in stats)
-    average_score = total_score / len(stats)
+    # Totali aggiornati a ogni submit: un solo lookup per chiave primaria
+    aggregate = await get_user_aggregate(db, user.id)
+    total_quizzes = aggregate.total_quizzes or 0
+    average_score = aggregate.total_score / total_quizzes if total_quizzes else 0.0
     
     return {
         "username": user.username,
-        "total_quizzes": len(stats),
+        "total_quizzes": total_quizzes,
         "average_score": round(average_score, 2),
-        "total_correct": total_correct,
-        "total_wrong": total_wrong,
-        "total_unanswered": total_unanswered,
-        "total_time_spent": total_time
+        "total_correct": aggregate.total_correct or 0,
+        "total_wrong": aggregate.total_wrong or 0,
+        "total_unanswered": aggregate.total_unanswered or 0,
+        "total_time_spent": aggregate.total_time_spent or 0
     }
 
-# Get quiz history
+# Get quiz history (keyset pagination, cursore nell'header X-Next-Cursor)
 @router.get("/history")
 async def get_history(
-    authorization: str = Header(None),
-    db: Session = Depends(get_db)
+    response: Response,
+    user: Principal = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    quiz_name: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    token = authorization.replace("Bearer ", "") if authorization else None
-    user = get_current_user(token, db)
-    
-    stats = db.query(QuizStat).filter(
-        QuizStat.user_id == user.id
-    ).order_by(QuizStat.completed_at.desc()).all()
+    query = select(QuizStat).where(QuizStat.user_id == user.id)
+    if quiz_name:
+        query = query.where(QuizStat.quiz_name == quiz_name)
+    if cursor:
+        try:
+            cursor_completed_at, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(or_(
+            QuizStat.completed_at < cursor_completed_at,
+            and_(QuizStat.completed_at == cursor_completed_at, QuizStat.id < cursor_id)
+        ))
+    
+    stats = (await db.scalars(
+        query.order_by(QuizStat.completed_at.desc(), QuizStat.id.desc()).limit(limit + 1)
+    )).all()
+    
+    if len(stats) > limit:
+        stats = stats[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(stats[-1].completed_at, stats[-1].id)
     
     history = []
     for stat in stats:
@@ -238,41 +306,41 @@ async def get_history(
     
     return history
 
-# Admin: Get all users
+# Admin: Get all users (paginato per id, cursore nell'header X-Next-Cursor)
 @router.get("/admin/users")
 async def get_all_users(
-    authorization: str = Header(None),
-    db: Session = Depends(get_db)
+    response: Response,
+    user: Principal = Depends(get_current_user),
+    limit: int = Query(100, ge=1, le=500),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    import httpx
-    
-    token = authorization.replace("Bearer ", "") if authorization else None
-    user = get_current_user(token, db)
-    
     # Check if user is admin (only kingdragone)
     if not user.is_admin or user.username != "kingdragone":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    users = db.query(User).all()
+    # Keyset pagination: niente OFFSET, si riparte dall'ultimo id visto
+    query = select(User)
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    users = (await db.scalars(query.order_by(User.id).limit(limit + 1))).all()
+    
+    if len(users) > limit:
+        users = users[:limit]
+        response.headers["X-Next-Cursor"] = str(users[-1].id)
+    
+    # Quiz count per tutti gli utenti della pagina con una sola query raggruppata
+    quiz_counts = dict((await db.execute(
+        select(QuizStat.user_id, func.count(QuizStat.id))
+        .where(QuizStat.user_id.in_([u.id for u in users]))
+        .group_by(QuizStat.user_id)
+    )).all())
+    
+    # Geolocalizzazione: cache, poi tabella ip_locations, poi lookup concorrenti
+    locations = await get_locations(db, [u.last_ip for u in users])
     
     users_list = []
     for u in users:
-        # Get quiz count for each user
-        quiz_count = db.query(QuizStat).filter(QuizStat.user_id == u.id).count()
-        
-        # Get geolocation for IP
-        location = None
-        if u.last_ip and u.last_ip not in ["127.0.0.1", "localhost", None]:
-            try:
-                async with httpx.AsyncClient(timeout=2.0) as client:
-                    response = await client.get(f"http://ip-api.com/json/{u.last_ip}")
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get("status") == "success":
-                            location = f"{data.get('city', '')}, {data.get('regionName', '')}, {data.get('country', '')}"
-            except:
-                location = "Unknown"
-        
         users_list.append({
             "id": u.id,
             "username": u.username,
@@ -280,8 +348,80 @@ async def get_all_users(
             "created_at": u.created_at.strftime("%Y-%m-%d %H:%M:%S"),
             "last_login": u.last_login.strftime("%Y-%m-%d %H:%M:%S") if u.last_login else "Never",
             "last_ip": u.last_ip or "N/A",
-            "location": location or "N/A",
-            "quiz_count": quiz_count
+            "location": locations.get(u.last_ip) or "N/A",
+            "quiz_count": quiz_counts.get(u.id, 0)
         })
     
     return users_list
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_COLUMNS = [
+    "id", "username", "quiz_name", "score", "max_score", "correct_answers", "wrong_answers",
+    "no_answers", "time_spent", "attempt_number", "completed_at"
+]
+
+def export_query(quiz_name: Optional[str], date_from: Optional[datetime], date_to: Optional[datetime]):
+    query = (
+        select(
+            QuizStat.id, User.username, QuizStat.quiz_name, QuizStat.score, QuizStat.max_score,
+            QuizStat.correct_answers, QuizStat.wrong_answers, QuizStat.no_answers,
+            QuizStat.time_spent, QuizStat.attempt_number, QuizStat.completed_at
+        )
+        .outerjoin(User, User.id == QuizStat.user_id)
+        .order_by(QuizStat.id)
+    )
+    if quiz_name:
+        query = query.where(QuizStat.quiz_name == quiz_name)
+    if date_from:
+        query = query.where(QuizStat.completed_at >= date_from)
+    if date_to:
+        query = query.where(QuizStat.completed_at < date_to)
+    return query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+async def stream_export(query, fmt: str):
+    """
+    Genera l'export a blocchi di EXPORT_BATCH_SIZE righe da un cursore lato server:
+    memoria costante e primi byte inviati subito. La sessione è propria dello stream,
+    indipendente da quella della richiesta.
+    """
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows(
+                    row[:-1] + (row.completed_at.isoformat() if row.completed_at else None,)
+                    for row in rows
+                )
+                yield buffer.getvalue()
+            else:
+                yield b"".join(
+                    orjson.dumps(dict(zip(EXPORT_COLUMNS, row))) + b"\n" for row in rows
+                )
+
+# Admin: export di tutte le statistiche (CSV o NDJSON, in streaming)
+@router.get("/admin/export")
+async def export_stats(
+    user: Principal = Depends(get_current_user),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    quiz_name: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    # Check if user is admin (only kingdragone)
+    if not user.is_admin or user.username != "kingdragone":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_export(export_query(quiz_name, date_from, date_to), format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="quiz_stats.{format}"'}
+    )
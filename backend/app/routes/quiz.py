@@ -1,23 +1,53 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Depends, Query
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from app.services.parser import parse_quiz_text
-from app.services.validator import validate_quiz_file
+from app.services.parser import parse_quiz_text, shuffle_question, issue_text, sample_quiz_text
+from app.services.library import store_quiz, get_quiz, get_cached_bank, get_quiz_file_id, get_questions_by_ref
+from app.services.search import search_questions
+from app.services.answers import record_answers, miss_weights, pick_weak_positions
+from app.services.question_bank import QuestionBank
+from app.services.parse_pool import scan_quiz_text_async, scan_quiz_stream
+from app.services.duplicates import duplicate_detector
+from app.services.quiz_session import (
+    new_seed, session_rng, question_rng, issue_session_token, issue_topic_session_token,
+    read_session_token, session_answers
+)
 from app.database import get_db
 from app.models.user import User, QuizStat
-from app.services.auth import verify_token
+from app.services.principal import load_principal_sync
+from app.services.stats import record_attempt, record_attempts, next_attempt_number, reserve_attempt_numbers
+from app.services.leaderboard import (
+    LEADERBOARD_SIZE, LeaderboardEntry, record_best_attempt, record_best_attempts,
+    update_top, invalidate_top, get_leaderboard, get_rank, count_participants
+)
+from app.services.quiz_engine import grade_answers, grade_batch, UnknownQuestionError
+from app.services.metrics import observe_parse, UPLOAD_BYTES, PARSE_FAILURES
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from typing import Optional
+import asyncio
+import codecs
+import orjson
+import logging
 import random
+import time
+from collections import Counter
 from datetime import datetime
 
-router = APIRouter(prefix="/quiz", tags=["Quiz"])
+router = APIRouter(prefix="/quiz", tags=["Quiz"], default_response_class=ORJSONResponse)
+logger = logging.getLogger(__name__)
 
 # Security settings
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
 ALLOWED_EXTENSIONS = [".txt"]
 BLACKLISTED_EXTENSIONS = [".py", ".pyc", ".pyw"]
 
-async def validate_file_upload(file: UploadFile) -> str:
-    """Validates file upload and returns content"""
+CHUNK_SIZE = 1024 * 1024  # 1 MB chunks
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def check_upload_filename(file: UploadFile):
+    """Controlla le estensioni consentite prima di leggere il file"""
     # Check blacklisted extensions
     if any(file.filename.endswith(ext) for ext in BLACKLISTED_EXTENSIONS):
         raise HTTPException(status_code=403, detail="Only .txt files allowed")
@@ -25,107 +55,262 @@ async def validate_file_upload(file: UploadFile) -> str:
     # Check extension
     if not any(file.filename.endswith(ext) for ext in ALLOWED_EXTENSIONS):
         raise HTTPException(status_code=400, detail="Only .txt files allowed")
-    
-    # Read file with size limit
-    content = b""
-    chunk_size = 1024 * 1024  # 1 MB chunks
+
+async def iter_upload_text(file: UploadFile):
+    """Legge l'upload a chunk con limite di dimensione e decodifica UTF-8 incrementale"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
     total_size = 0
     
     try:
         while True:
-            chunk = await file.read(chunk_size)
-            if not chunk:
-                break
-            total_size += len(chunk)
-            if total_size > MAX_FILE_SIZE:
+            chunk = await file.read(CHUNK_SIZE)
+            final = not chunk
+            if chunk:
+                total_size += len(chunk)
+                if total_size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413, 
+                        detail=f"File too large. Maximum size: {MAX_FILE_SIZE / 1024 / 1024:.1f} MB"
+                    )
+            # Decode with error handling (un carattere può essere spezzato tra due chunk)
+            try:
+                text = decoder.decode(chunk, final=final)
+            except UnicodeDecodeError:
                 raise HTTPException(
-                    status_code=413, 
-                    detail=f"File too large. Maximum size: {MAX_FILE_SIZE / 1024 / 1024:.1f} MB"
+                    status_code=400, 
+                    detail="File encoding error: expected UTF-8"
                 )
-            content += chunk
+            if text:
+                yield text
+            if final:
+                UPLOAD_BYTES.observe(total_size)
+                break
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
-    
-    # Decode with error handling
+
+async def scan_with_metrics(text: str):
+    """
+    scan_quiz_text con tempo di parse e domande per file esportati in /metrics.
+    I file grandi sono parsati nel pool di processi, fuori dall'event loop.
+    """
+    started = time.perf_counter()
+    result = await scan_quiz_text_async(text)
+    observe_parse(time.perf_counter() - started, len(result.questions))
+    if result.errors:
+        PARSE_FAILURES.inc()
+    return result
+
+async def validate_file_upload(file: UploadFile) -> str:
+    """Validates file upload and returns content"""
+    check_upload_filename(file)
+    return "".join([text async for text in iter_upload_text(file)])
+
+async def stream_upload_ndjson(file: UploadFile):
+    """
+    Genera una riga NDJSON per ogni domanda appena la sua porzione è parsata (nel pool di
+    processi per i file grandi), poi una riga finale di riepilogo con totali, errori e warning.
+    """
+    # Incrementale: non serve tenere le domande già inviate
+    detector = duplicate_detector()
+    loop = asyncio.get_running_loop()
+    errors, warnings = [], []
+    total = 0
+    started = time.perf_counter()
     try:
-        text = content.decode("utf-8")
-    except UnicodeDecodeError:
-        raise HTTPException(
-            status_code=400, 
-            detail="File encoding error: expected UTF-8"
-        )
-    
-    return text
+        async for result in scan_quiz_stream(iter_upload_text(file), file.size):
+            errors.extend(result.errors)
+            warnings.extend(result.warnings)
+            if detector is not None:
+                await loop.run_in_executor(None, detector.add_all, result.questions)
+            for q in result.questions:
+                total += 1
+                yield orjson.dumps({"type": "question", "question": shuffle_question(q)}) + b"\n"
+    except HTTPException as e:
+        yield orjson.dumps({"type": "error", "status_code": e.status_code, "detail": e.detail}) + b"\n"
+        return
+    observe_parse(time.perf_counter() - started, total)
+
+    yield orjson.dumps({
+        "type": "summary",
+        "total": total,
+        "errors": [issue_text(e) for e in errors],
+        "warnings": [issue_text(w) for w in warnings + (detector.warnings() if detector else [])]
+    }) + b"\n"
+
+def require_principal(authorization: Optional[str], db: Session):
+    principal = load_principal_sync(authorization.replace("Bearer ", ""), db) if authorization else None
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return principal
+
+def weak_weights(db: Session, user_id: int, quiz_id: str) -> dict:
+    return miss_weights(db, user_id, get_quiz_file_id(db, quiz_id))
 
 # 1️⃣ Endpoint POST /upload (test e caricamento)
 @router.post("/upload")
-async def upload_quiz(file: UploadFile = File(...)):
+async def upload_quiz(
+    file: UploadFile = File(...),
+    accept: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    # Modalità streaming: le domande arrivano man mano, senza salvare nella libreria
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        check_upload_filename(file)
+        return StreamingResponse(stream_upload_ndjson(file), media_type=NDJSON_MEDIA_TYPE)
+
     text = await validate_file_upload(file)
     
-    # Valida il file
-    errors, warnings = validate_quiz_file(text)
-    if errors:
-        raise HTTPException(status_code=400, detail=f"File errors: {'; '.join(errors)}")
+    # Valida e parsa il file in una sola passata
+    result = await scan_with_metrics(text)
+    if result.errors:
+        raise HTTPException(status_code=400, detail=f"File errors: {'; '.join(map(issue_text, result.errors))}")
+    warnings = [issue_text(w) for w in result.warnings]
     
-    questions = parse_quiz_text(text)
+    # Scrittura sincrona sul database: in un thread, non sull'event loop
+    quiz_id = await run_in_threadpool(store_quiz, db, text, file.filename, result.questions)
+    questions = [shuffle_question(q) for q in result.questions]
+    random.shuffle(questions)
 
-    return {
+    # Risposta serializzata direttamente con orjson (niente jsonable_encoder)
+    return ORJSONResponse({
+        "quiz_id": quiz_id,
         "total": len(questions), 
         "questions": questions,
         "warnings": warnings
-    }
+    })
 
 # 2️⃣ Endpoint POST /simulate (quiz randomizzato senza risposte corrette)
 @router.post("/simulate")
-async def simulate_quiz(file: UploadFile = File(...), max_questions: int = 31):
+async def simulate_quiz(
+    file: UploadFile = File(...),
+    max_questions: int = 31,
+    lazy: bool = False,
+    weak: bool = False,
+    authorization: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    # Modalità "domande deboli": serve l'utente per leggere i suoi esiti
+    principal = await run_in_threadpool(require_principal, authorization, db) if weak else None
+
+    result = None
     try:
         text = await validate_file_upload(file)
         
-        # Valida il file
-        errors, warnings = validate_quiz_file(text)
-        if errors:
-            print(f"Validation errors: {errors}")
-            raise HTTPException(status_code=400, detail=f"File errors: {'; '.join(errors)}")
+        # Valida e parsa il file in una sola passata (in modalità lazy la validazione completa è saltata)
+        if not lazy:
+            result = await scan_with_metrics(text)
+            errors = [issue_text(e) for e in result.errors]
+            if errors:
+                logger.info("Validation errors: %s", errors)
+                raise HTTPException(status_code=400, detail=f"File errors: {'; '.join(errors)}")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in simulate_quiz: {str(e)}")
+        logger.exception("Error in simulate_quiz")
         raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
     
-    questions = parse_quiz_text(text)
+    # Libreria: il file viene salvato solo al primo upload (scritture in un thread, non sull'event loop)
+    if lazy:
+        quiz_id = await run_in_threadpool(store_quiz, db, text, file.filename, lazy=True)
+        bank = get_cached_bank(quiz_id)
+    else:
+        quiz_id = await run_in_threadpool(store_quiz, db, text, file.filename, result.questions)
+        bank = get_cached_bank(quiz_id) or QuestionBank(result.questions)
+
+    # Estrazione e mescolamento riproducibili dal seed della sessione
+    seed = new_seed()
+    rng = session_rng(seed)
+
+    if principal is not None:
+        # Estrazione pesata sulle domande che l'utente sbaglia o salta più spesso
+        bank = bank or await run_in_threadpool(get_quiz, db, quiz_id)
+        warnings = [issue_text(w) for w in result.warnings] if result else []
+        weights = await run_in_threadpool(weak_weights, db, principal.id, quiz_id)
+        quiz = [bank.question(i) for i in pick_weak_positions(bank, weights, max_questions, rng)]
+    elif bank is not None:
+        warnings = [issue_text(w) for w in result.warnings] if result else []
+        # Limita a max_questions
+        quiz = [bank.question(i) for i in rng.sample(range(len(bank)), min(max_questions, len(bank)))]
+    else:
+        # Indice dei blocchi: si parsano solo le domande servite
+        started = time.perf_counter()
+        sampled = sample_quiz_text(text, max_questions, rng=rng)
+        observe_parse(time.perf_counter() - started, len(sampled.questions))
+        warnings = [issue_text(i) for i in sampled.errors + sampled.warnings]
+        quiz = sampled.questions
 
-    if not questions:
+    if not quiz:
         raise HTTPException(status_code=400, detail="No valid questions found after validation")
 
-    # Limita a max_questions
-    random.shuffle(questions)
-    quiz = questions[:min(max_questions, len(questions))]
+    # Mescola le opzioni delle sole domande servite
+    quiz = [shuffle_question(q, question_rng(seed, q["id"])) for q in quiz]
 
-    # Rimuovi indice corretto dalle opzioni (già mescolate dal parser)
+    # Rimuovi indice corretto dalle opzioni
     quiz_for_user = []
     for q in quiz:
         quiz_for_user.append({
+            "id": q["id"],
             "question": q["question"],
             "options": q["options"],
             "comment": q.get("comment", "")
         })
 
-    return {
+    return ORJSONResponse({
+        "quiz_id": quiz_id,
+        # Token firmato (seed, quiz e domande servite): basta rinviarlo al submit
+        "session": issue_session_token(quiz_id, seed, [q["id"] for q in quiz]),
         "total": len(quiz_for_user), 
         "questions": quiz_for_user,
         "warnings": warnings
-    }
+    })
+
+def topic_bank(db: Session, refs: list) -> QuestionBank:
+    """Domande di un quiz per argomento, con id 1..n nell'ordine servito"""
+    questions = get_questions_by_ref(db, refs)
+    return QuestionBank([{**q, "id": n} for n, q in enumerate(questions, start=1)])
+
+# Endpoint POST /simulate/topic (quiz da tutta la libreria, sulle domande che contengono le parole cercate)
+@router.post("/simulate/topic")
+def simulate_topic_quiz(
+    q: str = Query(..., min_length=3, max_length=200),
+    max_questions: int = 31,
+    db: Session = Depends(get_db)
+):
+    seed = new_seed()
+    refs = search_questions(db, q, max_questions, session_rng(seed))
+    if not refs:
+        raise HTTPException(status_code=404, detail="No questions found for this topic")
+    try:
+        bank = topic_bank(db, refs)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    quiz = [shuffle_question(bank.question(i), question_rng(seed, bank.question_id(i))) for i in range(len(bank))]
+    return ORJSONResponse({
+        "quiz_id": None,
+        "session": issue_topic_session_token(seed, refs),
+        "total": len(quiz),
+        "questions": [
+            {"id": x["id"], "question": x["question"], "options": x["options"], "comment": x.get("comment", "")}
+            for x in quiz
+        ],
+        "warnings": []
+    })
 
 # 3️⃣ Endpoint POST /submit (valutazione)
 class QuizAnswer(BaseModel):
-    question: str
-    answer: str
+    id: Optional[int] = None  # Id restituito da /simulate (preferito al testo)
+    question: Optional[str] = None
+    answer: str = ""
+    choice: Optional[int] = None  # Indice dell'opzione mostrata (solo con session)
 
 class QuizSubmitRequest(BaseModel):
     questions: list[QuizAnswer]
-    original_file_content: str
+    session: Optional[str] = None  # Token restituito da /simulate (risposte nell'ordine servito)
+    quiz_id: Optional[str] = None  # Restituito da /simulate
+    original_file_content: Optional[str] = None  # Deprecato: usare quiz_id
     quiz_name: str = "Unknown Quiz"
     time_spent: int = 0  # in seconds
 
@@ -135,93 +320,234 @@ def submit_quiz(
     authorization: str = Header(None),
     db: Session = Depends(get_db)
 ):
-    all_questions = parse_quiz_text(data.original_file_content)
-
-    # Dizionario delle risposte corrette
-    answer_key = {
-        q["question"]: {"correct_option": q["options"][q["correct"]], "comment": q.get("comment", "")}
-        for q in all_questions
-    }
-
-    total_questions = len(data.questions)
-    total_score = 0
-    correct_answers = 0
-    wrong_answers = 0
-    no_answers = 0
-    results = []
+    answers = [(q.id, q.question, q.answer) for q in data.questions]
+    quiz_id = data.quiz_id
 
-    for q in data.questions:
-        question_text = q.question
-        user_answer = q.answer
-        correct_option = answer_key[question_text]["correct_option"]
-        comment = answer_key[question_text]["comment"]
-
-        # Calcolo punteggio
-        is_correct = user_answer == correct_option
-        if user_answer == "":
-            score = 0  # non risposta
-            no_answers += 1
-        elif is_correct:
-            score = 1  # risposta corretta
-            correct_answers += 1
+    # Banca domande compatta (cache per quiz_id)
+    if data.session:
+        # Sessione firmata: quiz e domande servite vengono dal token, non dal client
+        session = read_session_token(data.session)
+        if session is None:
+            raise HTTPException(status_code=400, detail="Invalid or expired quiz session")
+        quiz_id = session.quiz_id
+        if session.sources is not None:
+            # Quiz per argomento: domande da più file, niente log per domanda
+            try:
+                bank = topic_bank(db, session.sources)
+            except ValueError as e:
+                raise HTTPException(status_code=404, detail=str(e))
         else:
-            score = -0.33  # risposta sbagliata
-            wrong_answers += 1
-
-        total_score += score
-
-        results.append({
-            "question": question_text,
-            "your_answer": user_answer,
-            "correct_answer": correct_option,
-            "is_correct": is_correct,
-            "score": score,
-            "comment": comment
-        })
+            bank = get_quiz(db, quiz_id)
+            if bank is None:
+                raise HTTPException(status_code=404, detail="Quiz not found")
+        try:
+            answers = session_answers(bank, session, [(q.id, q.answer, q.choice) for q in data.questions])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif data.quiz_id:
+        bank = get_quiz(db, data.quiz_id)
+        if bank is None:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+    elif data.original_file_content:
+        bank = QuestionBank(parse_quiz_text(data.original_file_content, shuffle=False))
+    else:
+        raise HTTPException(status_code=400, detail="Missing quiz_id")
 
-    max_score = total_questions
-    score_percentage = round((total_score / max_score) * 100, 2)
+    outcomes = []
+    try:
+        graded = grade_answers(bank, answers, outcomes=outcomes)
+    except UnknownQuestionError:
+        raise HTTPException(status_code=400, detail="Question not found in quiz")
 
     # Save statistics if user is authenticated
     if authorization:
         try:
             token = authorization.replace("Bearer ", "")
-            username = verify_token(token)
-            if username:
-                user = db.query(User).filter(User.username == username).first()
-                if user:
-                    # Get attempt number
-                    attempt_count = db.query(QuizStat).filter(
-                        QuizStat.user_id == user.id,
-                        QuizStat.quiz_name == data.quiz_name
-                    ).count()
-                    
-                    # Create new stat record
-                    new_stat = QuizStat(
-                        user_id=user.id,
-                        quiz_name=data.quiz_name,
-                        score=total_score,
-                        max_score=max_score,
-                        correct_answers=correct_answers,
-                        wrong_answers=wrong_answers,
-                        no_answers=no_answers,
-                        time_spent=data.time_spent,
-                        attempt_number=attempt_count + 1,
-                        completed_at=datetime.now()
-                    )
-                    db.add(new_stat)
-                    db.commit()
+            user = load_principal_sync(token, db)
+            if user:
+                # Get attempt number (contatore per utente e quiz)
+                attempt_number = next_attempt_number(db, user.id, data.quiz_name)
+                
+                # Create new stat record
+                new_stat = QuizStat(
+                    user_id=user.id,
+                    quiz_name=data.quiz_name,
+                    score=graded["total_score"],
+                    max_score=graded["max_score"],
+                    correct_answers=graded["correct_answers"],
+                    wrong_answers=graded["wrong_answers"],
+                    no_answers=graded["no_answers"],
+                    time_spent=data.time_spent,
+                    attempt_number=attempt_number,
+                    completed_at=datetime.now()
+                )
+                record_attempt(db, new_stat)
+                improved = record_best_attempt(db, new_stat)
+                # Esiti per domanda (solo per i quiz della libreria)
+                quiz_file_id = get_quiz_file_id(db, quiz_id) if quiz_id else None
+                if quiz_file_id is not None:
+                    record_answers(db, [(user.id, new_stat.id, quiz_file_id, outcomes)])
+                db.commit()
+                # Top-K in memoria aggiornata solo dopo il commit
+                if improved:
+                    update_top(data.quiz_name, LeaderboardEntry(
+                        user.id, user.username, round(new_stat.score, 2), new_stat.max_score,
+                        new_stat.time_spent, new_stat.id, new_stat.completed_at
+                    ))
         except Exception as e:
             # Don't fail the request if stats saving fails
-            print(f"Failed to save stats: {e}")
+            logger.exception("Failed to save stats")
 
-    return {
-        "total_questions": total_questions,
-        "correct_answers": correct_answers,
-        "wrong_answers": wrong_answers,
-        "no_answers": no_answers,
-        "total_score": round(total_score, 2),
-        "max_score": max_score,
-        "score_percentage": score_percentage,
+    graded["total_score"] = round(graded["total_score"], 2)
+    return ORJSONResponse(graded)
+
+# 4️⃣ Endpoint POST /submit/batch (correzione di una sessione d'esame, solo admin)
+class BatchSubmission(BaseModel):
+    username: str
+    questions: list[QuizAnswer]
+    time_spent: int = 0  # in seconds
+
+class QuizBatchSubmitRequest(BaseModel):
+    quiz_id: str
+    quiz_name: str = "Unknown Quiz"
+    submissions: list[BatchSubmission]
+    include_details: bool = False  # esito per domanda di ogni consegna
+
+@router.post("/submit/batch")
+def submit_quiz_batch(
+    data: QuizBatchSubmitRequest,
+    authorization: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    started = time.perf_counter()
+
+    principal = require_principal(authorization, db)
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    # Banca domande costruita (o presa dalla cache) una sola volta per tutto il batch
+    bank = get_quiz(db, data.quiz_id)
+    if bank is None:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+
+    usernames = {s.username for s in data.submissions}
+    user_ids = dict(db.query(User.username, User.id).filter(User.username.in_(usernames)).all())
+
+    quiz_file_id = get_quiz_file_id(db, data.quiz_id)
+
+    # Consegne di utenti esistenti corrette tutte insieme, in un'unica passata sulla chiave delle risposte
+    known = [s for s in data.submissions if s.username in user_ids]
+    graded_batch = iter(grade_batch(
+        bank,
+        [[(q.id, q.question, q.answer) for q in s.questions] for s in known],
+        details=data.include_details
+    ))
+
+    results = []
+    graded_by_user = []
+    for submission in data.submissions:
+        user_id = user_ids.get(submission.username)
+        if user_id is None:
+            results.append({"username": submission.username, "error": "User not found"})
+            continue
+        item = next(graded_batch)
+        if item is None:
+            results.append({"username": submission.username, "error": "Question not found in quiz"})
+            continue
+        graded, outcomes = item
+        graded_by_user.append((user_id, submission, graded, outcomes))
+        results.append({"username": submission.username, **graded, "total_score": round(graded["total_score"], 2)})
+
+    graded_at = time.perf_counter()
+
+    # Tutti i QuizStat con un solo INSERT bulk, poi totali e classifica con aggiornamenti incrementali
+    if graded_by_user:
+        user_counts = Counter(user_id for user_id, _, _, _ in graded_by_user)
+        next_attempts = reserve_attempt_numbers(db, user_counts, data.quiz_name)
+        completed_at = datetime.now()
+        rows = []
+        for user_id, submission, graded, _ in graded_by_user:
+            rows.append({
+                "user_id": user_id,
+                "quiz_name": data.quiz_name,
+                "score": graded["total_score"],
+                "max_score": graded["max_score"],
+                "correct_answers": graded["correct_answers"],
+                "wrong_answers": graded["wrong_answers"],
+                "no_answers": graded["no_answers"],
+                "time_spent": submission.time_spent,
+                "attempt_number": next_attempts[user_id],
+                "completed_at": completed_at
+            })
+            next_attempts[user_id] += 1
+        stat_ids = db.scalars(insert(QuizStat).returning(QuizStat.id, sort_by_parameter_order=True), rows).all()
+        record_answers(db, [
+            (user_id, stat_id, quiz_file_id, outcomes)
+            for stat_id, (user_id, _, _, outcomes) in zip(stat_ids, graded_by_user)
+        ])
+        record_attempts(db, rows)
+        record_best_attempts(db, data.quiz_name, list(zip(stat_ids, rows)))
+        db.commit()
+        invalidate_top(data.quiz_name)
+
+    finished = time.perf_counter()
+    graded_results = [r for r in results if "error" not in r]
+
+    return ORJSONResponse({
+        "total_submissions": len(data.submissions),
+        "graded": len(graded_results),
+        "failed": len(results) - len(graded_results),
+        "average_score_percentage": round(
+            sum(r["score_percentage"] for r in graded_results) / len(graded_results), 2
+        ) if graded_results else 0.0,
+        "timing": {
+            "grading_ms": round((graded_at - started) * 1000, 2),
+            "saving_ms": round((finished - graded_at) * 1000, 2),
+            "total_ms": round((finished - started) * 1000, 2)
+        },
         "results": results
+    })
+
+# 5️⃣ Classifiche per quiz (miglior tentativo per utente, pari merito al tempo minore)
+def leaderboard_item(rank: int, entry: LeaderboardEntry) -> dict:
+    return {
+        "rank": rank,
+        "username": entry.username,
+        "score": entry.score,
+        "max_score": entry.max_score,
+        "score_percentage": round(entry.score / entry.max_score * 100, 2) if entry.max_score else 0.0,
+        "time_spent": entry.time_spent,
+        "completed_at": entry.completed_at.strftime("%Y-%m-%d %H:%M:%S") if entry.completed_at else None
     }
+
+@router.get("/leaderboard")
+def leaderboard(
+    quiz_name: str,
+    limit: int = Query(10, ge=1, le=LEADERBOARD_SIZE),
+    authorization: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    require_principal(authorization, db)
+    entries = get_leaderboard(db, quiz_name, limit)
+    return [leaderboard_item(rank, entry) for rank, entry in enumerate(entries, start=1)]
+
+@router.get("/leaderboard/rank")
+def leaderboard_rank(
+    quiz_name: str,
+    username: Optional[str] = None,
+    authorization: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    principal = require_principal(authorization, db)
+    user_id = principal.id
+    if username and username != principal.username:
+        user_id = db.query(User.id).filter(User.username == username).scalar()
+        if user_id is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+    found = get_rank(db, quiz_name, user_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="No attempts for this quiz")
+    item = leaderboard_item(*found)
+    item["participants"] = count_participants(db, quiz_name)
+    return item
@@ -1,10 +1,102 @@
-from fastapi import APIRouter, UploadFile, File
+import asyncio
+import os
+import time
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from app.database import get_db
+from app.routes.quiz import MAX_FILE_SIZE, ALLOWED_EXTENSIONS, BLACKLISTED_EXTENSIONS
+from app.services.library import store_quiz
+from app.services.metrics import observe_parse, UPLOAD_BYTES, PARSE_FAILURES
+from app.services.parse_pool import PARSE_WORKERS, scan_archive_member_async
+from app.services.parser import issue_text
+from app.utils.file_loader import iter_zip_members, ArchiveError, MAX_ARCHIVE_SIZE
+
+# File dell'archivio in lavorazione contemporaneamente (parse e salvataggio, testo in memoria)
+UPLOAD_MEMBERS_IN_FLIGHT = int(os.getenv("UPLOAD_MEMBERS_IN_FLIGHT", str(PARSE_WORKERS)))
 
 router = APIRouter(
     prefix="/upload",
-    tags=["upload"]
+    tags=["upload"],
+    default_response_class=ORJSONResponse
 )
 
+async def _timed_scan(text: str):
+    started = time.perf_counter()
+    result = await scan_archive_member_async(text)
+    observe_parse(time.perf_counter() - started, len(result.questions))
+    if result.errors:
+        PARSE_FAILURES.inc()
+    return result
+
+async def _process_member(db: Session, store_lock: asyncio.Lock, filename: str, text: str) -> dict:
+    """Parse e salvataggio di un file dell'archivio; il testo non resta nel report"""
+    result = await _timed_scan(text)
+    quiz_id = None
+    if not result.errors and result.questions:
+        # Solo i file validi entrano nella libreria (deduplicati per hash); scritture fuori
+        # dall'event loop, una alla volta perché la sessione non è thread-safe
+        async with store_lock:
+            quiz_id = await run_in_threadpool(store_quiz, db, text, filename, result.questions)
+    return {
+        "filename": filename,
+        "quiz_id": quiz_id,
+        "total": len(result.questions),
+        "errors": [issue_text(e) for e in result.errors],
+        "warnings": [issue_text(w) for w in result.warnings]
+    }
+
+# Caricamento in blocco: archivio .zip con più file .txt
 @router.post("/quiz")
-async def upload_quiz(file: UploadFile = File(...)):
-    return {"filename": file.filename, "status": "uploaded"}
+async def upload_quiz(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    if not file.filename.endswith(".zip"):
+        raise HTTPException(status_code=400, detail="Only .zip archives allowed")
+
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, 2)
+        file.file.seek(0)
+    if size > MAX_ARCHIVE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Archive too large. Maximum size: {MAX_ARCHIVE_SIZE / 1024 / 1024:.1f} MB"
+        )
+    UPLOAD_BYTES.observe(size)
+
+    # Lettura un file alla volta in un thread; il parse di ogni file parte appena è letto.
+    # Al più UPLOAD_MEMBERS_IN_FLIGHT file in lavorazione: la lettura del successivo aspetta
+    # che uno finisca, e il testo di ogni file è rilasciato appena salvato
+    in_flight = asyncio.Semaphore(UPLOAD_MEMBERS_IN_FLIGHT)
+    store_lock = asyncio.Lock()
+
+    async def process(filename: str, text: str) -> dict:
+        try:
+            return await _process_member(db, store_lock, filename, text)
+        finally:
+            in_flight.release()
+
+    items = []  # report dei file scartati in lettura o task, nell'ordine dell'archivio
+    try:
+        members = iter_zip_members(file.file, ALLOWED_EXTENSIONS, BLACKLISTED_EXTENSIONS, MAX_FILE_SIZE)
+        async for member in iterate_in_threadpool(members):
+            if member.text is None:
+                items.append({"filename": member.filename, "quiz_id": None, "total": 0, "errors": [member.error], "warnings": []})
+                continue
+            await in_flight.acquire()
+            items.append(asyncio.ensure_future(process(member.filename, member.text)))
+    except ArchiveError as e:
+        for item in items:
+            if isinstance(item, asyncio.Future):
+                item.cancel()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    report = [await item if isinstance(item, asyncio.Future) else item for item in items]
+    valid_files = sum(1 for item in report if item["quiz_id"] is not None)
+    return ORJSONResponse({
+        "total_files": len(report),
+        "valid_files": valid_files,
+        "invalid_files": len(report) - valid_files,
+        "total_questions": sum(item["total"] for item in report if item["quiz_id"] is not None),
+        "files": report
+    })
@@ -0,0 +1,93 @@
+import heapq
+import os
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.database import upsert_insert
+from app.models.user import QuestionAnswer, UserQuestionStat
+from app.services.quiz_engine import OUTCOME_CORRECT, OUTCOME_WRONG, OUTCOME_BLANK
+
+# Quanto pesano gli errori nella scelta delle domande (1 = proporzionale al tasso di errore)
+WEAK_QUIZ_BIAS = float(os.getenv("WEAK_QUIZ_BIAS", "2"))
+
+def record_answers(db: Session, attempts: list):
+    """
+    Salva gli esiti per domanda di uno o più tentativi.
+    `attempts` è una lista di (user_id, stat_id, quiz_file_id, [(id domanda, esito), ...]).
+    Un insert bulk per il log e un upsert bulk per i totali per domanda; il commit resta al chiamante.
+    """
+    log_rows = []
+    totals = {}
+    for user_id, stat_id, quiz_file_id, outcomes in attempts:
+        seen = set()
+        for question_id, outcome in outcomes:
+            # Una domanda inviata due volte nello stesso tentativo conta una volta sola
+            if question_id in seen:
+                continue
+            seen.add(question_id)
+            log_rows.append({
+                "stat_id": stat_id,
+                "question_id": question_id,
+                "quiz_file_id": quiz_file_id,
+                "outcome": outcome
+            })
+            counts = totals.setdefault((user_id, quiz_file_id, question_id), [0, 0, 0, 0])
+            counts[0] += 1
+            counts[1] += outcome == OUTCOME_CORRECT
+            counts[2] += outcome == OUTCOME_WRONG
+            counts[3] += outcome == OUTCOME_BLANK
+
+    if not log_rows:
+        return
+    db.execute(insert(QuestionAnswer), log_rows)
+
+    upsert = upsert_insert(db, UserQuestionStat)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[UserQuestionStat.user_id, UserQuestionStat.quiz_file_id, UserQuestionStat.question_id],
+        set_={
+            "attempts": UserQuestionStat.attempts + upsert.excluded.attempts,
+            "correct": UserQuestionStat.correct + upsert.excluded.correct,
+            "wrong": UserQuestionStat.wrong + upsert.excluded.wrong,
+            "blank": UserQuestionStat.blank + upsert.excluded.blank,
+        }
+    )
+    db.execute(upsert, [
+        {
+            "user_id": user_id,
+            "quiz_file_id": quiz_file_id,
+            "question_id": question_id,
+            "attempts": counts[0],
+            "correct": counts[1],
+            "wrong": counts[2],
+            "blank": counts[3]
+        }
+        for (user_id, quiz_file_id, question_id), counts in totals.items()
+    ])
+
+def miss_weights(db: Session, user_id: int, quiz_file_id: int) -> dict:
+    """
+    {id domanda: peso} dai totali dell'utente su un file (range scan sulla chiave primaria).
+    Il peso è il tasso di errore (sbagliate + non risposte) con smoothing di Laplace:
+    le domande mai viste valgono 1/2, quelle sempre sbagliate si avvicinano a 1.
+    """
+    rows = db.query(
+        UserQuestionStat.question_id, UserQuestionStat.attempts, UserQuestionStat.correct
+    ).filter(
+        UserQuestionStat.user_id == user_id,
+        UserQuestionStat.quiz_file_id == quiz_file_id
+    ).all()
+    return {
+        question_id: ((attempts - correct + 1) / (attempts + 2)) ** WEAK_QUIZ_BIAS
+        for question_id, attempts, correct in rows
+    }
+
+def pick_weak_positions(bank, weights: dict, k: int, rng) -> list:
+    """
+    Estrae k posizioni del QuestionBank senza reinserimento, con probabilità proporzionale
+    al peso (Efraimidis-Spirakis: chiave u^(1/w), si tengono le k chiavi maggiori).
+    """
+    unseen = 0.5 ** WEAK_QUIZ_BIAS
+    keys = [
+        rng.random() ** (1 / weights.get(bank.question_id(i), unseen))
+        for i in range(len(bank))
+    ]
+    return heapq.nlargest(min(k, len(bank)), range(len(bank)), key=keys.__getitem__)
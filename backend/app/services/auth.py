@@ -1,20 +1,72 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from typing import Optional
+from typing import Optional, Tuple
+from app.services.metrics import BCRYPT_SECONDS
 
 # Security config
 SECRET_KEY = "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24  # 30 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Costo bcrypt: cambiandolo, gli hash esistenti vengono aggiornati al login successivo
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Thread dedicati all'hashing (bcrypt rilascia il GIL) e richieste massime in coda
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class HashingBusyError(Exception):
+    """Troppe operazioni bcrypt in coda: meglio un 503 veloce che latenza per tutti"""
+
+class HashingPool:
+    """Executor limitato per bcrypt, con backpressure sulla profondità della coda"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def run(self, func, *args):
+        # Contatore modificato solo dall'event loop: non serve un lock
+        if self.pending >= self.max_pending:
+            raise HashingBusyError()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+hashing_pool = HashingPool(HASH_WORKERS, HASH_MAX_PENDING)
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    with BCRYPT_SECONDS.labels("hash").time():
+        return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with BCRYPT_SECONDS.labels("verify").time():
+        return pwd_context.verify(plain_password, hashed_password)
+
+def _verify_and_update(plain_password: str, hashed_password: str):
+    with BCRYPT_SECONDS.labels("verify").time():
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    return await hashing_pool.run(hash_password, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica fuori dall'event loop. Se l'hash usa un costo diverso da BCRYPT_ROUNDS
+    ritorna anche il nuovo hash da salvare, altrimenti None.
+    """
+    return await hashing_pool.run(_verify_and_update, plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -0,0 +1,136 @@
+import os
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # brotli è opzionale: senza, si negozia solo gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # byte
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # qualità bassa: risposte dinamiche
+
+# Contenuti già compressi o binari: non vale la pena ricomprimerli
+SKIP_CONTENT_TYPES = (b"image/", b"video/", b"audio/", b"application/zip", b"application/gzip")
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Sceglie la codifica dall'header Accept-Encoding (brotli preferito a gzip)."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+class _Compressor:
+    """Interfaccia comune a zlib (gzip) e brotli: compress, flush e finish."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._br.process(data) if self.encoding == "br" else self._gz.compress(data)
+
+    def flush(self) -> bytes:
+        # Svuota il buffer senza chiudere lo stream (risposte in streaming, es. NDJSON)
+        return self._br.flush() if self.encoding == "br" else self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._br.finish() if self.encoding == "br" else self._gz.flush()
+
+class CompressionMiddleware:
+    """
+    Comprime le risposte con brotli o gzip secondo l'Accept-Encoding del client.
+    Le risposte più piccole di COMPRESS_MIN_SIZE restano invariate; quelle in streaming
+    vengono compresse blocco per blocco, così ogni riga arriva subito al client.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                # Si attende il primo blocco del body per decidere
+                state["start"] = message
+                return
+
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            compressor = state["compressor"]
+
+            if compressor is None:
+                start = state["start"]
+                response_headers = dict(start["headers"])
+                content_type = response_headers.get(b"content-type", b"")
+                if (
+                    b"content-encoding" in response_headers
+                    or content_type.startswith(SKIP_CONTENT_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressor = state["compressor"] = _Compressor(encoding)
+                out_headers = [
+                    (k, v) for k, v in start["headers"]
+                    if k not in (b"content-length", b"content-encoding")
+                ]
+                out_headers.append((b"content-encoding", encoding.encode()))
+                vary = response_headers.get(b"vary")
+                if vary is None:
+                    out_headers.append((b"vary", b"Accept-Encoding"))
+                elif b"accept-encoding" not in vary.lower():
+                    out_headers = [(k, v) for k, v in out_headers if k != b"vary"]
+                    out_headers.append((b"vary", vary + b", Accept-Encoding"))
+
+                if not more_body:
+                    # Risposta completa: si conosce la lunghezza compressa
+                    data = compressor.compress(body) + compressor.finish()
+                    out_headers.append((b"content-length", str(len(data)).encode()))
+                    await send({**start, "headers": out_headers})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send({**start, "headers": out_headers})
+
+            if more_body:
+                data = compressor.compress(body) + compressor.flush()
+            else:
+                data = compressor.compress(body) + compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+        # Risposta senza messaggi di body: si inoltra l'intestazione trattenuta
+        if state["start"] is not None and state["compressor"] is None and not state["passthrough"]:
+            await send(state["start"])
+            await send({"type": "http.response.body", "body": b""})
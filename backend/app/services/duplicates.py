@@ -0,0 +1,148 @@
+import os
+import re
+import zlib
+from array import array
+from typing import Optional
+
+# off | exact | near: le domande identiche costano un dizionario, le quasi uguali
+# (MinHash/LSH) diverse volte il parse e vanno attivate esplicitamente
+DUPLICATE_CHECK = os.getenv("DUPLICATE_CHECK", "exact")
+# Similarità (Jaccard sulle coppie di parole) oltre cui due domande sono quasi uguali
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.75"))
+
+# MinHash/LSH: 8 bande da 4 valori. Due domande con similarità 0.75 finiscono nello
+# stesso bucket in almeno una banda con probabilità ~95% (0.85: >99%), con 0.3 ~6%.
+# Le coppie candidate sono poi verificate con il Jaccard esatto
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+MINHASH_BINS = MINHASH_BANDS * MINHASH_ROWS
+
+WORD_RE = re.compile(r"\w+")
+EMPTY_BIN = -1  # gli hash crc32 non sono mai negativi
+_EMPTY_BAND = (EMPTY_BIN,) * MINHASH_ROWS
+
+def _exact_key(q: dict) -> str:
+    # Solo operazioni in C (il parser ha già tolto gli spazi ai bordi di ogni riga)
+    return "\n".join([q["question"], *q["options"]]).lower()
+
+def _words(q: dict) -> list:
+    return WORD_RE.findall(" ".join([q["question"], *q["options"]]).lower())
+
+def _shingles(words: list) -> array:
+    """
+    Shingle = coppie di parole consecutive (la parola singola per i testi di una parola).
+    crc32 e non hash(): hash() delle stringhe cambia a ogni processo (PYTHONHASHSEED),
+    i risultati devono essere gli stessi nei processi del pool e tra un'esecuzione e l'altra.
+    """
+    pairs = map(" ".join, zip(words, words[1:])) if len(words) > 1 else words
+    return array("L", set(map(zlib.crc32, map(str.encode, pairs))))
+
+def _band_keys(shingles: array) -> list:
+    """
+    MinHash a una sola permutazione: ogni shingle cade in un bin (hash modulo MINHASH_BINS)
+    e ogni bin tiene il minimo, in un solo passaggio invece di uno per valore della firma.
+    Ritorna la chiave di ogni banda (None per le bande con tutti i bin vuoti); le tuple
+    di interi hanno un hash stabile tra processi.
+    """
+    ordered = sorted(shingles, reverse=True)
+    # Con gli hash in ordine decrescente l'ultimo scritto in ogni bin è il minimo
+    bins = dict(zip(map(MINHASH_BINS.__rmod__, ordered), ordered))
+    signature = [bins.get(i, EMPTY_BIN) for i in range(MINHASH_BINS)]
+    return [
+        None if key == _EMPTY_BAND else hash(key)
+        for key in zip(*[iter(signature)] * MINHASH_ROWS)
+    ]
+
+def _similarity(a: array, b: array) -> float:
+    if min(len(a), len(b)) < DUPLICATE_THRESHOLD * max(len(a), len(b)):
+        return 0.0  # Jaccard <= rapporto tra le dimensioni
+    common = len(set(a).intersection(b))
+    return common / (len(a) + len(b) - common)
+
+class DuplicateDetector:
+    """
+    Riconosce le domande ripetute in un file, una domanda alla volta:
+    - uguali (a meno di maiuscole): dizionario sul testo di domanda e opzioni
+    - quasi uguali: firma MinHash e bucket LSH per banda; ogni domanda è confrontata (Jaccard
+      esatto sugli shingle) solo con il primo elemento dei bucket in cui cade, al più
+      MINHASH_BANDS confronti
+    Costo lineare nel numero di domande, niente confronti a coppie.
+    """
+
+    def __init__(self, near: bool = True):
+        self._near = near
+        self._exact = {}  # testo normalizzato -> primo esercizio
+        self._buckets = [{} for _ in range(MINHASH_BANDS)]  # chiave banda -> primo esercizio
+        self._shingles = {}  # esercizio -> shingle (solo le domande non ripetute), per la verifica
+        self._exact_groups = {}  # primo esercizio -> ripetizioni identiche
+        self._near_root = {}  # esercizio -> primo esercizio del suo gruppo
+        self._near_groups = {}  # primo esercizio -> domande quasi uguali
+
+    def add(self, q: dict):
+        exercise = q["id"]
+        first = self._exact.setdefault(_exact_key(q), exercise)
+        if first != exercise:
+            self._exact_groups.setdefault(first, []).append(exercise)
+            return
+        if not self._near:
+            return
+
+        words = _words(q)
+        if not words:
+            return
+        shingles = _shingles(words)
+        self._shingles[exercise] = shingles
+
+        checked = set()
+        match = None
+        for key, buckets in zip(_band_keys(shingles), self._buckets):
+            if key is None:
+                continue
+            candidate = buckets.setdefault(key, exercise)
+            if match is not None or candidate == exercise or candidate in checked:
+                continue
+            checked.add(candidate)
+            if _similarity(shingles, self._shingles[candidate]) >= DUPLICATE_THRESHOLD:
+                match = candidate
+
+        if match is not None:
+            root = self._near_root.get(match, match)
+            self._near_root[exercise] = root
+            self._near_groups.setdefault(root, []).append(exercise)
+
+    def warnings(self) -> list:
+        """Un warning per gruppo, sul primo esercizio, con tutti gli esercizi coinvolti"""
+        found = []
+        for first, repeats in self._exact_groups.items():
+            exercises = [first, *repeats]
+            found.append({
+                "exercise": first,
+                "message": f"duplicate question, repeated in exercises {', '.join(map(str, repeats))}",
+                "exercises": exercises
+            })
+        for first, similar in self._near_groups.items():
+            found.append({
+                "exercise": first,
+                "message": f"near-duplicate question, similar to exercises {', '.join(map(str, similar))}",
+                "exercises": [first, *similar]
+            })
+        found.sort(key=lambda w: w["exercise"])
+        return found
+
+    def add_all(self, questions: list):
+        for q in questions:
+            self.add(q)
+
+def duplicate_detector() -> Optional[DuplicateDetector]:
+    """Detector configurato da DUPLICATE_CHECK, None se il controllo è disattivato"""
+    if DUPLICATE_CHECK == "off":
+        return None
+    return DuplicateDetector(near=DUPLICATE_CHECK == "near")
+
+def find_duplicates(questions: list) -> list:
+    """Warning per le domande ripetute o quasi uguali (formato degli altri warning del parser)"""
+    detector = duplicate_detector()
+    if detector is None:
+        return []
+    detector.add_all(questions)
+    return detector.warnings()
@@ -0,0 +1,121 @@
+import asyncio
+import os
+from datetime import timedelta
+from typing import Optional
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import utc_now
+from app.models.geo import IpLocation
+from app.utils.cache import LRUCache
+
+GEO_CONCURRENCY = int(os.getenv("GEO_CONCURRENCY", "10"))
+GEO_TIMEOUT = float(os.getenv("GEO_TIMEOUT", "2.0"))
+GEO_TTL_SECONDS = int(os.getenv("GEO_TTL_SECONDS", str(30 * 24 * 3600)))  # 30 giorni
+GEO_CACHE_SIZE = int(os.getenv("GEO_CACHE_SIZE", "10000"))
+
+LOCAL_IPS = {"127.0.0.1", "localhost", "::1"}
+UNKNOWN_LOCATION = "Unknown"
+
+class IpApiResolver:
+    """Risolve un IP tramite ip-api.com, riusando un solo client HTTP"""
+
+    def __init__(self, timeout: float = GEO_TIMEOUT):
+        self.timeout = timeout
+        self._client = None
+
+    async def resolve(self, ip: str) -> Optional[str]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        response = await self._client.get(f"http://ip-api.com/json/{ip}")
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        if data.get("status") != "success":
+            return None
+        return f"{data.get('city', '')}, {data.get('regionName', '')}, {data.get('country', '')}"
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class StaticResolver:
+    """Resolver locale da dizionario (test o database offline già caricato)"""
+
+    def __init__(self, locations: dict):
+        self.locations = locations
+
+    async def resolve(self, ip: str) -> Optional[str]:
+        return self.locations.get(ip)
+
+_resolver = IpApiResolver()
+
+# ip -> location ("" = nessun risultato, da non ritentare)
+location_cache = LRUCache(GEO_CACHE_SIZE, ttl=GEO_TTL_SECONDS)
+
+def set_geo_resolver(resolver):
+    """Sostituisce il resolver (qualsiasi oggetto con `async resolve(ip)`)"""
+    global _resolver
+    _resolver = resolver
+    location_cache.clear()
+
+async def close_geo_resolver():
+    """Chiude le connessioni del resolver corrente (allo shutdown dell'app)"""
+    aclose = getattr(_resolver, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+async def _resolve_concurrently(ips: list) -> dict:
+    semaphore = asyncio.Semaphore(GEO_CONCURRENCY)
+
+    async def resolve_one(ip):
+        async with semaphore:
+            try:
+                return ip, await _resolver.resolve(ip) or ""
+            except Exception:
+                return ip, UNKNOWN_LOCATION
+
+    return dict(await asyncio.gather(*(resolve_one(ip) for ip in ips)))
+
+async def get_locations(db: AsyncSession, ips) -> dict:
+    """
+    Ritorna {ip: location} per gli IP pubblici richiesti.
+    Ordine di lookup: cache in memoria, tabella ip_locations, resolver (in parallelo, limitato).
+    """
+    wanted = {ip for ip in ips if ip and ip not in LOCAL_IPS}
+    locations = {}
+
+    missing = []
+    for ip in wanted:
+        location = location_cache.get(ip)
+        if location is not None:
+            locations[ip] = location
+        else:
+            missing.append(ip)
+
+    if missing:
+        cutoff = utc_now() - timedelta(seconds=GEO_TTL_SECONDS)
+        rows = (await db.execute(
+            select(IpLocation).where(
+                IpLocation.ip.in_(missing),
+                IpLocation.resolved_at >= cutoff
+            )
+        )).scalars().all()
+        for row in rows:
+            locations[row.ip] = row.location
+            location_cache.put(row.ip, row.location)
+        missing = [ip for ip in missing if ip not in locations]
+
+    if missing:
+        resolved = await _resolve_concurrently(missing)
+        now = utc_now()
+        for ip, location in resolved.items():
+            locations[ip] = location
+            location_cache.put(ip, location)
+            # Gli errori di rete restano solo in memoria, così verranno ritentati
+            if location != UNKNOWN_LOCATION:
+                await db.merge(IpLocation(ip=ip, location=location, resolved_at=now))
+        await db.commit()
+
+    return locations
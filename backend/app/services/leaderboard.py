@@ -0,0 +1,271 @@
+import bisect
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import NamedTuple, Optional
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import upsert_insert
+from app.models.user import User, QuizStat, QuizBestAttempt
+from app.utils.cache import LRUCache
+
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))  # top-K tenuto in memoria per quiz
+LEADERBOARD_CACHE_QUIZZES = int(os.getenv("LEADERBOARD_CACHE_QUIZZES", "256"))
+# Con più worker ogni processo aggiorna solo la propria copia: la ttl limita quanto può restare indietro
+LEADERBOARD_CACHE_TTL = int(os.getenv("LEADERBOARD_CACHE_TTL", "60"))  # secondi
+
+class LeaderboardEntry(NamedTuple):
+    user_id: int
+    username: str
+    score: float
+    max_score: int
+    time_spent: int
+    stat_id: int
+    completed_at: datetime
+
+def rank_key(entry) -> tuple:
+    """Punteggio decrescente, poi tempo crescente, poi il tentativo più vecchio"""
+    return (-entry.score, entry.time_spent, entry.stat_id)
+
+# quiz_name -> lista ordinata (chiavi, entry) dei primi LEADERBOARD_SIZE
+top_cache = LRUCache(LEADERBOARD_CACHE_QUIZZES, ttl=LEADERBOARD_CACHE_TTL)
+_top_lock = threading.Lock()
+
+def _better_than(score: float, time_spent: int):
+    """Condizione SQL: la riga migliore è peggiore del tentativo (score, time_spent)"""
+    return or_(
+        QuizBestAttempt.score < score,
+        and_(QuizBestAttempt.score == score, QuizBestAttempt.time_spent > time_spent)
+    )
+
+def record_best_attempt(db: Session, stat: QuizStat) -> bool:
+    """
+    Aggiorna il miglior tentativo di (utente, quiz) se `stat` (già flushato) lo supera.
+    Ritorna True se la classifica è cambiata. Il commit resta al chiamante.
+    """
+    score = round(stat.score, 2)
+    values = {
+        "stat_id": stat.id,
+        "score": score,
+        "max_score": stat.max_score,
+        "time_spent": stat.time_spent,
+        "completed_at": stat.completed_at,
+    }
+    key = and_(QuizBestAttempt.user_id == stat.user_id, QuizBestAttempt.quiz_name == stat.quiz_name)
+    improve = update(QuizBestAttempt).where(key, _better_than(score, stat.time_spent)).values(**values)
+    if db.execute(improve).rowcount:
+        return True
+    if db.query(QuizBestAttempt.user_id).filter(key).first() is not None:
+        return False
+
+    # Primo tentativo in classifica (o precedente alla tabella: si parte dal migliore in quiz_stats)
+    try:
+        with db.begin_nested():
+            refresh_best_attempts(db, stat.quiz_name, [stat.user_id])
+        return True
+    except IntegrityError:
+        # Riga creata nel frattempo da un submit concorrente
+        return bool(db.execute(improve).rowcount)
+
+def record_best_attempts(db: Session, quiz_name: str, attempts: list):
+    """
+    Versione bulk di record_best_attempt per i tentativi di un batch, [(stat_id, riga dict), ...]:
+    il migliore di ogni utente entra con un upsert che sostituisce la riga esistente solo
+    se è peggiore, senza rileggere lo storico. Il commit resta al chiamante.
+    """
+    best = {}
+    for stat_id, row in attempts:
+        entry = {
+            "user_id": row["user_id"],
+            "quiz_name": quiz_name,
+            "stat_id": stat_id,
+            "score": round(row["score"], 2),
+            "max_score": row["max_score"],
+            "time_spent": row["time_spent"],
+            "completed_at": row["completed_at"]
+        }
+        current = best.get(row["user_id"])
+        key = (-entry["score"], entry["time_spent"], stat_id)
+        if current is None or key < (-current["score"], current["time_spent"], current["stat_id"]):
+            best[row["user_id"]] = entry
+
+    existing = set(db.scalars(
+        select(QuizBestAttempt.user_id).where(
+            QuizBestAttempt.quiz_name == quiz_name, QuizBestAttempt.user_id.in_(list(best))
+        )
+    ))
+    # Senza riga in classifica anche i tentativi precedenti alla tabella: si parte da quiz_stats
+    missing = sorted(best.keys() - existing)
+    for row in (_best_rows(db, quiz_name, missing) if missing else []):
+        best[row.user_id] = {
+            "user_id": row.user_id,
+            "quiz_name": row.quiz_name,
+            "stat_id": row.id,
+            "score": round(row.score, 2),
+            "max_score": row.max_score,
+            "time_spent": row.time_spent,
+            "completed_at": row.completed_at
+        }
+
+    upsert = upsert_insert(db, QuizBestAttempt)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[QuizBestAttempt.user_id, QuizBestAttempt.quiz_name],
+        set_={
+            "stat_id": upsert.excluded.stat_id,
+            "score": upsert.excluded.score,
+            "max_score": upsert.excluded.max_score,
+            "time_spent": upsert.excluded.time_spent,
+            "completed_at": upsert.excluded.completed_at,
+        },
+        # Anche una riga creata nel frattempo da un submit concorrente è sostituita solo se peggiore
+        where=_better_than(upsert.excluded.score, upsert.excluded.time_spent)
+    )
+    db.execute(upsert, [best[user_id] for user_id in sorted(best)])
+
+def _best_rows(db: Session, quiz_name: Optional[str] = None, user_ids=None):
+    """Miglior tentativo per (utente, quiz) calcolato da quiz_stats con una window function"""
+    position = func.row_number().over(
+        partition_by=(QuizStat.user_id, QuizStat.quiz_name),
+        order_by=(QuizStat.score.desc(), QuizStat.time_spent.asc(), QuizStat.id.asc())
+    ).label("position")
+    ranked = select(
+        QuizStat.id, QuizStat.user_id, QuizStat.quiz_name, QuizStat.score,
+        QuizStat.max_score, QuizStat.time_spent, QuizStat.completed_at, position
+    ).where(QuizStat.user_id.is_not(None))
+    if quiz_name is not None:
+        ranked = ranked.where(QuizStat.quiz_name == quiz_name)
+    if user_ids is not None:
+        ranked = ranked.where(QuizStat.user_id.in_(user_ids))
+    ranked = ranked.subquery()
+    return db.execute(select(ranked).where(ranked.c.position == 1)).all()
+
+def refresh_best_attempts(db: Session, quiz_name: Optional[str] = None, user_ids=None) -> int:
+    """
+    Ricalcola da quiz_stats i migliori tentativi (filtrati per quiz e utenti se indicati):
+    una query, una DELETE e un insert bulk. Il commit resta al chiamante.
+    """
+    rows = _best_rows(db, quiz_name, user_ids)
+    delete = db.query(QuizBestAttempt)
+    if quiz_name is not None:
+        delete = delete.filter(QuizBestAttempt.quiz_name == quiz_name)
+    if user_ids is not None:
+        delete = delete.filter(QuizBestAttempt.user_id.in_(user_ids))
+    delete.delete(synchronize_session=False)
+    db.add_all([
+        QuizBestAttempt(
+            user_id=row.user_id,
+            quiz_name=row.quiz_name,
+            stat_id=row.id,
+            score=round(row.score, 2),
+            max_score=row.max_score,
+            time_spent=row.time_spent,
+            completed_at=row.completed_at
+        )
+        for row in rows
+    ])
+    db.flush()
+    return len(rows)
+
+def _rank_order():
+    return (QuizBestAttempt.score.desc(), QuizBestAttempt.time_spent.asc(), QuizBestAttempt.stat_id.asc())
+
+def _load_top(db: Session, quiz_name: str) -> list:
+    rows = db.execute(
+        select(
+            QuizBestAttempt.user_id, User.username, QuizBestAttempt.score, QuizBestAttempt.max_score,
+            QuizBestAttempt.time_spent, QuizBestAttempt.stat_id, QuizBestAttempt.completed_at
+        )
+        .join(User, User.id == QuizBestAttempt.user_id)
+        .where(QuizBestAttempt.quiz_name == quiz_name)
+        .order_by(*_rank_order())
+        .limit(LEADERBOARD_SIZE)
+    ).all()
+    entries = [LeaderboardEntry(*row) for row in rows]
+    return [(rank_key(e), e) for e in entries]
+
+def _cached_top(db: Session, quiz_name: str) -> list:
+    # La query gira fuori dal lock: il lock protegge solo le liste in memoria
+    top = top_cache.get(quiz_name)
+    if top is None:
+        top = _load_top(db, quiz_name)
+        top_cache.put(quiz_name, top)
+    return top
+
+def get_leaderboard(db: Session, quiz_name: str, limit: int = LEADERBOARD_SIZE) -> list:
+    """Primi `limit` (al massimo LEADERBOARD_SIZE) dalla cache; una query solo al primo accesso"""
+    top = _cached_top(db, quiz_name)
+    with _top_lock:
+        return [entry for _, entry in top[:limit]]
+
+def update_top(quiz_name: str, entry: LeaderboardEntry):
+    """
+    Inserisce un nuovo miglior tentativo nella top-K in memoria (dopo il commit).
+    Il vecchio tentativo dello stesso utente viene rimosso: il nuovo è sempre migliore,
+    quindi se il vecchio era in classifica lo è anche il nuovo.
+    """
+    with _top_lock:
+        top = top_cache.get(quiz_name)
+        if top is None:
+            return  # verrà caricata dal database alla prossima lettura
+        top[:] = [item for item in top if item[1].user_id != entry.user_id]
+        key = rank_key(entry)
+        if len(top) >= LEADERBOARD_SIZE and key >= top[-1][0]:
+            return
+        bisect.insort(top, (key, entry))
+        del top[LEADERBOARD_SIZE:]
+
+def invalidate_top(quiz_name: str):
+    top_cache.pop(quiz_name)
+
+def get_rank(db: Session, quiz_name: str, user_id: int) -> Optional[tuple]:
+    """(posizione, entry) dell'utente nella classifica del quiz; None se non ha tentativi"""
+    top = _cached_top(db, quiz_name)
+    with _top_lock:
+        for position, (_, entry) in enumerate(top, start=1):
+            if entry.user_id == user_id:
+                return position, entry
+
+    best = db.get(QuizBestAttempt, (user_id, quiz_name))
+    if best is None:
+        return None
+    # Fuori dalla top-K: conteggio sull'indice (quiz_name, score, time_spent, stat_id)
+    ahead = db.query(func.count()).select_from(QuizBestAttempt).filter(
+        QuizBestAttempt.quiz_name == quiz_name,
+        or_(
+            QuizBestAttempt.score > best.score,
+            and_(QuizBestAttempt.score == best.score, QuizBestAttempt.time_spent < best.time_spent),
+            and_(
+                QuizBestAttempt.score == best.score,
+                QuizBestAttempt.time_spent == best.time_spent,
+                QuizBestAttempt.stat_id < best.stat_id
+            )
+        )
+    ).scalar()
+    username = db.query(User.username).filter(User.id == user_id).scalar()
+    return ahead + 1, LeaderboardEntry(
+        user_id, username, best.score, best.max_score, best.time_spent, best.stat_id, best.completed_at
+    )
+
+def count_participants(db: Session, quiz_name: str) -> int:
+    return db.query(func.count()).select_from(QuizBestAttempt).filter(
+        QuizBestAttempt.quiz_name == quiz_name
+    ).scalar()
+
+if __name__ == "__main__":
+    # Backfill: python -m app.services.leaderboard rebuild
+    from app.database import SessionLocal, engine
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python -m app.services.leaderboard rebuild")
+        sys.exit(1)
+
+    QuizBestAttempt.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        count = refresh_best_attempts(db)
+        db.commit()
+        print(f"Rebuilt {count} best attempts")
+    finally:
+        db.close()
@@ -0,0 +1,131 @@
+import hashlib
+import os
+from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.library import QuizFile
+from app.services.parser import parse_quiz_text
+from app.services.question_bank import QuestionBank
+from app.services.search import add_documents
+from app.utils.cache import LRUCache
+
+QUIZ_CACHE_SIZE = int(os.getenv("QUIZ_CACHE_SIZE", "32"))
+
+# quiz_id -> QuestionBank
+quiz_cache = LRUCache(QUIZ_CACHE_SIZE)
+# quiz_id -> chiave primaria in quiz_files (le tabelle per domanda usano l'intero, non l'hash)
+file_id_cache = LRUCache(QUIZ_CACHE_SIZE * 64)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _cache_entry(quiz_id: str, questions: list) -> QuestionBank:
+    bank = QuestionBank(questions)
+    quiz_cache.put(quiz_id, bank)
+    return bank
+
+def store_quiz(
+    db: Session,
+    text: str,
+    filename: str,
+    questions: Optional[list] = None,
+    lazy: bool = False
+) -> str:
+    """
+    Salva il file nella libreria (deduplicato per hash) e ritorna il quiz_id.
+    Se il contenuto è già presente il file non viene riparsato.
+    `questions` evita un secondo parse quando il chiamante ha già scansionato il testo;
+    con `lazy=True` si salva solo il testo e il parse è rimandato a get_quiz.
+    """
+    quiz_id = content_hash(text)
+    if quiz_cache.get(quiz_id) is not None:
+        return quiz_id
+
+    existing = db.query(QuizFile).filter(QuizFile.content_hash == quiz_id).first()
+    if existing:
+        if existing.questions is not None:
+            _cache_entry(quiz_id, existing.questions)
+        return quiz_id
+
+    if questions is None and not lazy:
+        questions = parse_quiz_text(text, shuffle=False)
+    quiz_file = QuizFile(
+        content_hash=quiz_id,
+        filename=filename,
+        content=text,
+        questions=questions,
+        question_count=len(questions) if questions is not None else None
+    )
+    db.add(quiz_file)
+    try:
+        db.flush()
+        if questions is not None:
+            add_documents(db, quiz_file.id, questions)
+        db.commit()
+    except IntegrityError:
+        # Upload concorrente dello stesso file: la riga esiste già
+        db.rollback()
+
+    if questions is not None:
+        _cache_entry(quiz_id, questions)
+    return quiz_id
+
+def get_cached_bank(quiz_id: str) -> Optional[QuestionBank]:
+    """Domande già parsate in cache, senza toccare il database"""
+    return quiz_cache.get(quiz_id)
+
+def get_quiz(db: Session, quiz_id: str) -> Optional[QuestionBank]:
+    """Ritorna il QuestionBank dalla cache o dal database"""
+    bank = quiz_cache.get(quiz_id)
+    if bank is not None:
+        return bank
+
+    quiz_file = db.query(QuizFile).filter(QuizFile.content_hash == quiz_id).first()
+    if not quiz_file:
+        return None
+
+    if quiz_file.questions is None:
+        # File salvato in modalità lazy: parse completo al primo utilizzo
+        questions = parse_quiz_text(quiz_file.content, shuffle=False)
+        quiz_file.questions = questions
+        quiz_file.question_count = len(questions)
+        try:
+            add_documents(db, quiz_file.id, questions)
+            db.commit()
+        except IntegrityError:
+            # Primo parse concorrente dello stesso file: si usano le righe già salvate dall'altro
+            db.rollback()
+            if quiz_file.questions is None:
+                return _cache_entry(quiz_id, questions)
+    return _cache_entry(quiz_id, quiz_file.questions)
+
+def get_quiz_file_id(db: Session, quiz_id: str) -> Optional[int]:
+    file_id = file_id_cache.get(quiz_id)
+    if file_id is None:
+        file_id = db.query(QuizFile.id).filter(QuizFile.content_hash == quiz_id).scalar()
+        if file_id is not None:
+            file_id_cache.put(quiz_id, file_id)
+    return file_id
+
+def get_questions_by_ref(db: Session, refs: list) -> list:
+    """
+    Domande (dict come QuestionBank.question) da più file della libreria,
+    nell'ordine di `refs` = [(id file, id domanda), ...]. ValueError se una manca.
+    """
+    file_ids = {file_id for file_id, _ in refs}
+    hashes = dict(db.query(QuizFile.id, QuizFile.content_hash).filter(QuizFile.id.in_(file_ids)).all())
+    banks = {}
+    questions = []
+    for file_id, question_id in refs:
+        bank = banks.get(file_id)
+        if bank is None:
+            bank = get_quiz(db, hashes[file_id]) if file_id in hashes else None
+            if bank is None:
+                raise ValueError("Quiz file not found")
+            banks[file_id] = bank
+            file_id_cache.put(hashes[file_id], file_id)
+        i = bank.position(question_id)
+        if i is None:
+            raise ValueError("Question not found in quiz")
+        questions.append(bank.question(i))
+    return questions
@@ -0,0 +1,137 @@
+import contextvars
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from starlette.routing import Match
+
+REQUEST_LATENCY = Histogram(
+    "upquiz_request_duration_seconds", "Request latency by route",
+    ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "upquiz_requests_in_flight", "Requests currently being served",
+    multiprocess_mode="livesum"
+)
+UPLOAD_BYTES = Histogram(
+    "upquiz_upload_bytes", "Size of uploaded quiz files",
+    buckets=(1e3, 1e4, 1e5, 5e5, 1e6, 2e6, 5e6)
+)
+PARSE_SECONDS = Histogram("upquiz_parse_duration_seconds", "Time spent parsing/validating a quiz file")
+QUESTIONS_PARSED = Histogram(
+    "upquiz_questions_parsed", "Questions parsed per file",
+    buckets=(10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+)
+DB_QUERIES = Histogram(
+    "upquiz_db_queries_per_request", "Database queries issued per request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+DB_QUERY_SECONDS = Histogram(
+    "upquiz_db_query_seconds_per_request", "Database time per request",
+    ["route"]
+)
+BCRYPT_SECONDS = Histogram(
+    "upquiz_bcrypt_duration_seconds", "bcrypt hash/verify time",
+    ["operation"], buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0)
+)
+PARSE_FAILURES = Counter("upquiz_parse_failures", "Quiz files rejected by validation")
+LOGIN_RATE_LIMITED = Counter("upquiz_login_rate_limited", "Login attempts rejected by the rate limiter")
+WORKER_BOOT_SECONDS = Gauge(
+    "upquiz_worker_boot_seconds", "Time from process start (or fork) to app ready",
+    multiprocess_mode="all"
+)
+
+_boot_started = time.perf_counter()
+
+def mark_boot_start():
+    """Riparte il cronometro di avvio (chiamato dopo il fork di ogni worker)"""
+    global _boot_started
+    _boot_started = time.perf_counter()
+
+def observe_boot() -> float:
+    elapsed = time.perf_counter() - _boot_started
+    WORKER_BOOT_SECONDS.set(elapsed)
+    return elapsed
+
+class RequestStats:
+    """Contatori DB della richiesta corrente (condivisi anche con il threadpool)"""
+    __slots__ = ("queries", "query_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+_request_stats = contextvars.ContextVar("upquiz_request_stats", default=None)
+
+def observe_parse(seconds: float, questions: int):
+    PARSE_SECONDS.observe(seconds)
+    QUESTIONS_PARSED.observe(questions)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("upquiz_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["upquiz_query_start"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started
+
+def instrument_engine(sync_engine):
+    """Conta query e tempo DB per richiesta tramite gli eventi di SQLAlchemy (idempotente)"""
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+def _route_template(app, scope) -> str:
+    # Template della route ("/api/quiz/submit"), non il path: cardinalità limitata
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+class MetricsMiddleware:
+    """Middleware ASGI: latenza per route, richieste in corso, query DB per richiesta"""
+
+    def __init__(self, app, fastapi_app):
+        self.app = app
+        self.fastapi_app = fastapi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            _request_stats.reset(token)
+            route = _route_template(self.fastapi_app, scope)
+            REQUEST_LATENCY.labels(scope["method"], route, str(status["code"])).observe(elapsed)
+            DB_QUERIES.labels(route).observe(stats.queries)
+            DB_QUERY_SECONDS.labels(route).observe(stats.query_seconds)
+
+def render_metrics():
+    """Testo in formato Prometheus; con più worker aggrega i file di PROMETHEUS_MULTIPROC_DIR"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from app.services.duplicates import find_duplicates
+from app.services.parser import (
+    ParseResult, QuizStreamParser, scan_quiz_text, scan_quiz_chunk, split_quiz_text, split_complete_blocks
+)
+
+logger = logging.getLogger(__name__)
+
+# Sotto questa dimensione (caratteri) il parse resta inline: costa meno del passaggio ai processi
+PARSE_PARALLEL_THRESHOLD = int(os.getenv("PARSE_PARALLEL_THRESHOLD", str(512 * 1024)))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+PARSE_CHUNK_SIZE = int(os.getenv("PARSE_CHUNK_SIZE", str(256 * 1024)))  # caratteri per porzione (indicativo)
+# Per i file di un archivio: sotto questa dimensione il parse inline costa meno dell'invio a un processo
+PARSE_POOL_MIN_SIZE = int(os.getenv("PARSE_POOL_MIN_SIZE", str(64 * 1024)))
+
+class ParsePool:
+    """
+    Pool di processi per il parse dei file grandi, creato al primo utilizzo
+    (mai nel master gunicorn) e con processi avviati via spawn: niente fork
+    di un processo che ha già thread ed event loop attivi.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        """Pool rotto (un processo è morto): il prossimo utilizzo ne crea uno nuovo"""
+        if self._executor is executor:
+            logger.warning("Parse pool broken, restarting it")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func, *args):
+        """
+        Esegue una funzione (importabile a livello di modulo) in un processo del pool.
+        Se il pool si è rotto viene ricreato e la chiamata ritentata una volta.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def scan(self, text: str) -> ParseResult:
+        """
+        Divide il testo ai confini "Esercizio X.", parsa le porzioni in parallelo e
+        le unisce nell'ordine: numerazione, errori e warning (duplicati compresi)
+        come con scan_quiz_text.
+        """
+        loop = asyncio.get_running_loop()
+        parts = max(1, min(self.workers, len(text) // PARSE_CHUNK_SIZE))
+        # Anche la ricerca dei confini è una passata sul testo intero: fuori dall'event loop
+        chunks = await loop.run_in_executor(None, split_quiz_text, text, parts)
+        results = await asyncio.gather(*(self.run(scan_quiz_chunk, chunk, offset) for chunk, offset in chunks))
+
+        questions, errors, warnings = [], [], []
+        for result in results:
+            questions.extend(result.questions)
+            errors.extend(result.errors)
+            warnings.extend(result.warnings)
+        # I duplicati vanno cercati sul file intero, dopo l'unione delle porzioni
+        warnings.extend(await self.run(find_duplicates, questions))
+        return ParseResult(questions, errors, warnings)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+parse_pool = ParsePool(PARSE_WORKERS)
+
+async def _scan_inline(text: str) -> ParseResult:
+    # Parse inline (file piccolo), ricerca dei duplicati in un thread fuori dall'event loop
+    result = scan_quiz_text(text, duplicates=False)
+    duplicates = await asyncio.get_running_loop().run_in_executor(None, find_duplicates, result.questions)
+    result.warnings.extend(duplicates)
+    return result
+
+async def scan_quiz_text_async(text: str) -> ParseResult:
+    """scan_quiz_text che non blocca l'event loop sui file grandi"""
+    if len(text) < PARSE_PARALLEL_THRESHOLD or PARSE_WORKERS < 1:
+        return await _scan_inline(text)
+    return await parse_pool.scan(text)
+
+async def scan_archive_member_async(text: str) -> ParseResult:
+    """
+    Parse di un file di un archivio: i file medi vanno interi a un processo del pool
+    (più file in parallelo), quelli grandi sono anche divisi in porzioni.
+    """
+    if PARSE_WORKERS < 1 or len(text) < PARSE_POOL_MIN_SIZE:
+        return await _scan_inline(text)
+    if len(text) >= PARSE_PARALLEL_THRESHOLD:
+        return await parse_pool.scan(text)
+    return await parse_pool.run(scan_quiz_text, text)
+
+async def scan_quiz_stream(chunks, size: Optional[int] = None):
+    """
+    Parse di un testo che arriva a pezzi (async iterable di stringhe): genera un
+    ParseResult per porzione, nell'ordine del file, con la numerazione di scan_quiz_text.
+    Sopra PARSE_PARALLEL_THRESHOLD le porzioni, tagliate ai confini dei blocchi, vanno ai
+    processi del pool (fino a PARSE_WORKERS alla volta); sotto, parser incrementale inline.
+    """
+    if PARSE_WORKERS < 1 or size is None or size < PARSE_PARALLEL_THRESHOLD:
+        parser = QuizStreamParser()
+        seen_errors = seen_warnings = 0
+        async for text in chunks:
+            questions = list(parser.feed(text))
+            yield ParseResult(questions, parser.errors[seen_errors:], parser.warnings[seen_warnings:])
+            seen_errors, seen_warnings = len(parser.errors), len(parser.warnings)
+        questions = list(parser.close())
+        yield ParseResult(questions, parser.errors[seen_errors:], parser.warnings[seen_warnings:])
+        return
+
+    pending = deque()
+    buffer = ""
+    offset = 0
+    try:
+        async for text in chunks:
+            buffer += text
+            if len(buffer) < PARSE_CHUNK_SIZE:
+                continue
+            complete, buffer, blocks = split_complete_blocks(buffer)
+            if not blocks:
+                continue
+            pending.append(asyncio.ensure_future(parse_pool.run(scan_quiz_chunk, complete, offset)))
+            offset += blocks
+            if len(pending) >= parse_pool.workers:
+                yield await pending.popleft()
+        pending.append(asyncio.ensure_future(parse_pool.run(scan_quiz_chunk, buffer, offset)))
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # Upload interrotto o client disconnesso: niente lavoro inutile nel pool
+        for task in pending:
+            task.cancel()
@@ -1,53 +1,269 @@
 import re
 import random
+from typing import NamedTuple, Optional
+from app.services.duplicates import find_duplicates
 
-def parse_quiz_text(text: str):
-    questions = []
+# Compilata una sola volta: separa i blocchi "Esercizio X."
+EXERCISE_RE = re.compile(r"Esercizio\s+\d+\.")
 
-    # Divide il testo in blocchi "Esercizio X."
-    blocks = re.split(r"Esercizio\s+\d+\.", text)
-    blocks = [b.strip() for b in blocks if b.strip()]
+OPTION_LETTERS = "ABCD"
 
-    for block in blocks:
-        lines = [line.strip() for line in block.split("\n") if line.strip()]
+class ParseResult(NamedTuple):
+    questions: list
+    errors: list  # [{"exercise": int | None, "message": str}]
+    warnings: list
 
-        question = lines[0]
-        options = []
-        correct_letter = None
-        comment = None
+def issue_text(issue: dict) -> str:
+    """Formatta un errore/warning strutturato come stringa leggibile"""
+    if issue["exercise"] is None:
+        return issue["message"]
+    return f"Exercise {issue['exercise']}: {issue['message']}"
 
-        for line in lines[1:]:
-            if re.match(r"[A-D]\)", line):
-                options.append(line[3:].strip())
-            elif line.startswith("Risposta:"):
-                correct_letter = line.replace("Risposta:", "").strip()
-            elif line.startswith("Commento:"):
-                comment = line.replace("Commento:", "").strip()
+def _parse_block(block: str, exercise_num: int, errors: list, warnings: list) -> Optional[dict]:
+    """
+    Analizza un singolo blocco in una sola passata sulle righe.
+    Ritorna la domanda (opzioni non mescolate) oppure None se il blocco non è valido.
+    """
+    question = None
+    options = []
+    correct_letter = None
+    comment = None
 
-        # Validazione: salta se non ha risposta valida o opzioni
-        if not correct_letter or correct_letter not in "ABCD" or len(options) == 0:
+    for line in block.split("\n"):
+        line = line.strip()
+        if not line:
             continue
-        
-        correct_index = ord(correct_letter) - ord("A")
-
-        # Shuffle delle opzioni
-        indexed_options = list(enumerate(options))
-        random.shuffle(indexed_options)
-
-        new_options = []
-        new_correct_index = None
-
-        for new_index, (old_index, text_opt) in enumerate(indexed_options):
-            new_options.append(text_opt)
-            if old_index == correct_index:
-                new_correct_index = new_index
-
-        questions.append({
-            "question": question,
-            "options": new_options,
-            "correct": new_correct_index,
-            "comment": comment
+        if question is None:
+            question = line
+        # Fast path: niente regex, "A)".."D)" si riconosce dai primi due caratteri
+        elif line[1:2] == ")" and line[0] in OPTION_LETTERS:
+            options.append(line[2:].strip())
+        elif line.startswith("Risposta:"):
+            if correct_letter is None:
+                correct_letter = line[9:].strip()
+        elif line.startswith("Commento:"):
+            comment = line[9:].strip()
+
+    if question is None:
+        errors.append({"exercise": exercise_num, "message": "empty block"})
+        return None
+
+    if len(question) < 3:
+        warnings.append({"exercise": exercise_num, "message": "question too short"})
+
+    valid = True
+    if not options:
+        errors.append({"exercise": exercise_num, "message": "no options A-D found"})
+        valid = False
+    elif len(options) < 2:
+        warnings.append({"exercise": exercise_num, "message": "less than 2 options"})
+
+    if correct_letter is None:
+        errors.append({"exercise": exercise_num, "message": "missing 'Risposta:'"})
+        valid = False
+    elif not correct_letter:
+        warnings.append({"exercise": exercise_num, "message": "empty 'Risposta:', question skipped"})
+        valid = False
+    elif len(correct_letter) != 1 or correct_letter not in OPTION_LETTERS:
+        errors.append({
+            "exercise": exercise_num,
+            "message": f"Answer '{correct_letter}' is invalid (must be A, B, C or D)"
         })
+        valid = False
+    elif options and ord(correct_letter) - ord("A") >= len(options):
+        errors.append({"exercise": exercise_num, "message": f"Answer '{correct_letter}' has no matching option"})
+        valid = False
+
+    if not valid:
+        return None
+
+    return {
+        "id": exercise_num,
+        "question": question,
+        "options": options,
+        "correct": ord(correct_letter) - ord("A"),
+        "comment": comment
+    }
+
+# Un'intestazione "Esercizio X." può essere spezzata tra due chunk:
+# a ogni feed si riesamina solo la coda del buffer precedente
+HEADER_LOOKBACK = 64
+
+class QuizStreamParser:
+    """
+    Parser incrementale a blocchi: riceve il testo a pezzi e produce ogni
+    domanda appena il suo blocco "Esercizio X." viene chiuso dal successivo.
+    Errori e warning si accumulano in `errors` / `warnings`.
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.exercise_num = 0
+        self._buffer = ""
+        self._scan_pos = 0
+
+    def _close_block(self, block: str) -> Optional[dict]:
+        if not block.strip():
+            return None
+        self.exercise_num += 1
+        return _parse_block(block, self.exercise_num, self.errors, self.warnings)
+
+    def feed(self, text: str):
+        """Aggiunge testo e genera le domande dei blocchi completati"""
+        buffer = self._buffer + text
+        pos = 0
+        for match in EXERCISE_RE.finditer(buffer, self._scan_pos):
+            question = self._close_block(buffer[pos:match.start()])
+            if question is not None:
+                yield question
+            pos = match.end()
+        # Un solo slice per feed: il buffer contiene solo il blocco aperto
+        self._buffer = buffer[pos:]
+        self._scan_pos = max(0, len(self._buffer) - HEADER_LOOKBACK)
+
+    def close(self):
+        """Chiude l'ultimo blocco e genera l'eventuale domanda finale"""
+        question = self._close_block(self._buffer)
+        self._buffer = ""
+        self._scan_pos = 0
+        if question is not None:
+            yield question
+        if self.exercise_num == 0:
+            self.errors.append({"exercise": None, "message": "Empty file"})
+
+def scan_quiz_text(text: str, duplicates: bool = True) -> ParseResult:
+    """
+    Tokenizer unico: valida e parsa il file in una sola passata lineare.
+    Le domande sono nell'ordine del file, con le opzioni non mescolate.
+    Con `duplicates` i warning includono le domande ripetute o quasi uguali.
+    """
+    parser = QuizStreamParser()
+    questions = list(parser.feed(text or ""))
+    questions.extend(parser.close())
+    if duplicates:
+        parser.warnings.extend(find_duplicates(questions))
+    return ParseResult(questions, parser.errors, parser.warnings)
+
+def scan_quiz_chunk(text: str, exercise_offset: int) -> ParseResult:
+    """
+    Come scan_quiz_text su una porzione del file che inizia all'inizio di un blocco:
+    gli esercizi sono numerati a partire da exercise_offset + 1.
+    """
+    parser = QuizStreamParser()
+    parser.exercise_num = exercise_offset
+    questions = list(parser.feed(text))
+    questions.extend(parser.close())
+    return ParseResult(questions, parser.errors, parser.warnings)
+
+def split_quiz_text(text: str, parts: int) -> list:
+    """
+    Divide il testo in al più `parts` porzioni contigue con confini sugli "Esercizio X.".
+    Ritorna [(porzione, exercise_offset)]: parsate con scan_quiz_chunk e concatenate
+    nell'ordine danno lo stesso risultato di scan_quiz_text.
+    """
+    offsets = index_blocks(text)
+    if len(offsets) < 2 or parts < 2:
+        return [(text, 0)]
+
+    per_part = -(-len(offsets) // parts)
+    chunks = []
+    for first in range(0, len(offsets), per_part):
+        last = min(first + per_part, len(offsets)) - 1
+        # La prima porzione parte da 0 (eventuale testo prima del primo blocco compreso)
+        start = offsets[first][0] if first else 0
+        end = offsets[last + 1][0] if last + 1 < len(offsets) else len(text)
+        chunks.append((text[start:end], first))
+    return chunks
+
+def split_complete_blocks(text: str) -> tuple:
+    """
+    Per il testo che arriva a pezzi: separa i blocchi sicuramente completi dall'ultimo,
+    che può continuare nel pezzo successivo. Ritorna (completi, resto, numero di blocchi
+    completi); `completi` si parsa con scan_quiz_chunk, il resto si accoda al pezzo dopo.
+    """
+    offsets = index_blocks(text)
+    if len(offsets) < 2:
+        return "", text, 0
+    cut = offsets[-1][0]
+    return text[:cut], text[cut:], len(offsets) - 1
+
+NON_SPACE_RE = re.compile(r"\S")
+
+def index_blocks(text: str) -> list:
+    """
+    Scansione economica dei soli confini: ritorna gli offset (start, end)
+    dei blocchi non vuoti, senza analizzarne le righe.
+    """
+    offsets = []
+    pos = 0
+    for match in EXERCISE_RE.finditer(text):
+        if NON_SPACE_RE.search(text, pos, match.start()):
+            offsets.append((pos, match.start()))
+        pos = match.end()
+    if NON_SPACE_RE.search(text, pos):
+        offsets.append((pos, len(text)))
+    return offsets
+
+def sample_quiz_text(text: str, k: int, offsets: Optional[list] = None, rng=random) -> ParseResult:
+    """
+    Parsa solo k blocchi scelti a caso (in ordine casuale); `rng` permette un'estrazione riproducibile.
+    I blocchi non validi vengono scartati e rimpiazzati da altri estratti;
+    gli errori dei blocchi analizzati finiscono in `errors`.
+    """
+    if offsets is None:
+        offsets = index_blocks(text)
+
+    questions = []
+    errors = []
+    warnings = []
+    tried = set()
+
+    while len(questions) < k and len(tried) < len(offsets):
+        untried = len(offsets) - len(tried)
+        for _ in range(min(k - len(questions), untried)):
+            # Estrazione senza reinserimento: O(k) invece di permutare tutti i blocchi
+            i = rng.randrange(len(offsets))
+            while i in tried:
+                i = rng.randrange(len(offsets))
+            tried.add(i)
+            start, end = offsets[i]
+            question = _parse_block(text[start:end], i + 1, errors, warnings)
+            if question is not None:
+                questions.append(question)
+
+    return ParseResult(questions, errors, warnings)
+
+def shuffle_question(q: dict, rng=random) -> dict:
+    """Ritorna una copia della domanda con le opzioni mescolate (con `rng` se indicato)"""
+    indexed_options = list(enumerate(q["options"]))
+    rng.shuffle(indexed_options)
+
+    new_options = []
+    new_correct_index = None
+
+    for new_index, (old_index, text_opt) in enumerate(indexed_options):
+        new_options.append(text_opt)
+        if old_index == q["correct"]:
+            new_correct_index = new_index
+
+    return {
+        "id": q.get("id"),
+        "question": q["question"],
+        "options": new_options,
+        "correct": new_correct_index,
+        "comment": q["comment"]
+    }
+
+def parse_quiz_text(text: str, shuffle: bool = True):
+    questions = scan_quiz_text(text, duplicates=False).questions
+
+    if not shuffle:
+        # Ordine originale del file (usato per la libreria persistente)
+        return questions
+
+    # Shuffle delle opzioni
+    questions = [shuffle_question(q) for q in questions]
 
     # Shuffle delle domande
     random.shuffle(questions)
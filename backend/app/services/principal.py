@@ -0,0 +1,98 @@
+import os
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+from jose import JWTError, jwt
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models.user import User
+from app.services.auth import SECRET_KEY, ALGORITHM
+from app.utils.cache import LRUCache
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# Le generazioni sono per processo: una modifica invalida subito la cache solo nel worker
+# che la esegue, negli altri il principal resta valido al più per la ttl
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "5"))  # secondi
+
+class Principal(NamedTuple):
+    """Utente autenticato: solo i campi necessari alle route, senza sessione ORM"""
+    id: int
+    username: str
+    is_admin: bool
+
+# token -> (principal, scadenza del JWT, generazione dell'utente)
+principal_cache = LRUCache(PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+# username -> generazione: incrementata a ogni modifica, invalida tutti i token dell'utente (in questo processo)
+_user_generations = {}
+
+def invalidate_user(username: str):
+    _user_generations[username] = _user_generations.get(username, 0) + 1
+
+def _decode(token: str):
+    """Ritorna (username, exp) oppure None se il token non è valido"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+    return username, payload.get("exp")
+
+def _cached(token: str) -> Optional[Principal]:
+    item = principal_cache.get(token)
+    if item is None:
+        return None
+    principal, exp, generation = item
+    if exp is not None and exp <= datetime.now(timezone.utc).timestamp():
+        principal_cache.pop(token)
+        return None
+    if generation != _user_generations.get(principal.username, 0):
+        principal_cache.pop(token)
+        return None
+    return principal
+
+def _remember(token: str, row, exp) -> Principal:
+    principal = Principal(row.id, row.username, bool(row.is_admin))
+    principal_cache.put(token, (principal, exp, _user_generations.get(principal.username, 0)))
+    return principal
+
+def _principal_select(username: str):
+    return select(User.id, User.username, User.is_admin).where(User.username == username)
+
+async def load_principal(token: str, db: AsyncSession) -> Optional[Principal]:
+    """Principal dalla cache; solo al primo uso del token decodifica il JWT e legge l'utente"""
+    principal = _cached(token)
+    if principal is not None:
+        return principal
+    decoded = _decode(token)
+    if decoded is None:
+        return None
+    username, exp = decoded
+    row = (await db.execute(_principal_select(username))).first()
+    return _remember(token, row, exp) if row else None
+
+def load_principal_sync(token: str, db: Session) -> Optional[Principal]:
+    """Come load_principal, per le route sincrone"""
+    principal = _cached(token)
+    if principal is not None:
+        return principal
+    decoded = _decode(token)
+    if decoded is None:
+        return None
+    username, exp = decoded
+    row = db.execute(_principal_select(username)).first()
+    return _remember(token, row, exp) if row else None
+
+@event.listens_for(User, "after_update")
+def _invalidate_on_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.username.history.has_changes() or state.attrs.is_admin.history.has_changes():
+        invalidate_user(target.username)
+        for old_username in state.attrs.username.history.deleted:
+            invalidate_user(old_username)
+
+@event.listens_for(User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target):
+    invalidate_user(target.username)
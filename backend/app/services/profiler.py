@@ -0,0 +1,62 @@
+import cProfile
+import io
+import os
+import pstats
+from app.database import AsyncSessionLocal
+from app.services.principal import load_principal
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_LIMIT = int(os.getenv("PROFILE_LIMIT", "60"))  # righe di output
+
+class ProfilerMiddleware:
+    """
+    Profilazione opt-in: se un admin invia l'header `X-Profile: 1` la richiesta viene
+    eseguita sotto cProfile e la risposta è sostituita dal report (text/plain).
+    Il profiler vede il codice eseguito sul thread dell'event loop: il lavoro delle
+    route sincrone, che gira nel threadpool, compare solo come attesa.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not await self._requested_by_admin(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": None}
+
+        async def capture(message):
+            # La risposta originale viene scartata: si invia il report
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            profiler.disable()
+
+        out = io.StringIO()
+        out.write(f"{scope['method']} {scope['path']} -> {status['code']}\n\n")
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LIMIT)
+        body = out.getvalue().encode()
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _requested_by_admin(self, scope) -> bool:
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER) not in (b"1", b"true"):
+            return False
+        authorization = headers.get(b"authorization", b"").decode()
+        if not authorization:
+            return False
+        async with AsyncSessionLocal() as db:
+            principal = await load_principal(authorization.replace("Bearer ", ""), db)
+        return principal is not None and principal.is_admin
@@ -0,0 +1,116 @@
+from array import array
+from bisect import bisect_left
+from typing import Optional
+
+class QuestionBank:
+    """
+    Rappresentazione compatta di un file di domande già parsato.
+    Tutte le stringhe (internate) stanno in un unico buffer con un array di offset;
+    per ogni domanda si tengono solo indici interi. L'id di una domanda è il numero
+    dell'esercizio nel file, quindi domande con lo stesso testo restano distinte.
+    """
+
+    __slots__ = (
+        "_buffer", "_offsets", "_ids", "_texts", "_comments",
+        "_option_starts", "_options", "_correct", "_text_index", "_answer_key", "_id_index"
+    )
+
+    def __init__(self, questions: list):
+        interned = {}
+        chunks = []
+        offsets = array("L", [0])
+
+        def intern(s: str) -> int:
+            string_id = interned.get(s)
+            if string_id is None:
+                string_id = len(interned)
+                interned[s] = string_id
+                chunks.append(s)
+                offsets.append(offsets[-1] + len(s))
+            return string_id
+
+        self._ids = array("L")
+        self._texts = array("L")
+        self._comments = array("l")  # -1 = nessun commento
+        self._option_starts = array("L", [0])
+        self._options = array("L")
+        self._correct = array("b")
+
+        for position, q in enumerate(questions):
+            # Righe salvate prima dell'introduzione degli id: si usa la posizione
+            self._ids.append(q.get("id") or position + 1)
+            self._texts.append(intern(q["question"]))
+            self._comments.append(intern(q["comment"]) if q.get("comment") is not None else -1)
+            for option in q["options"]:
+                self._options.append(intern(option))
+            self._option_starts.append(len(self._options))
+            self._correct.append(q["correct"])
+
+        self._buffer = "".join(chunks)
+        self._offsets = offsets
+        self._text_index = None
+        self._answer_key = None
+        self._id_index = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _string(self, string_id: int) -> str:
+        return self._buffer[self._offsets[string_id]:self._offsets[string_id + 1]]
+
+    def position(self, question_id: int) -> Optional[int]:
+        """Posizione interna di un id (ricerca binaria: gli id sono crescenti)"""
+        i = bisect_left(self._ids, question_id)
+        if i < len(self._ids) and self._ids[i] == question_id:
+            return i
+        return None
+
+    def position_by_text(self, text: str) -> Optional[int]:
+        """Compatibilità con i client che inviano il testo: indice costruito al primo uso"""
+        if self._text_index is None:
+            index = {}
+            for i in range(len(self._texts)):
+                index.setdefault(self._string(self._texts[i]), i)
+            self._text_index = index
+        return self._text_index.get(text)
+
+    def question_id(self, i: int) -> int:
+        return self._ids[i]
+
+    def text(self, i: int) -> str:
+        return self._string(self._texts[i])
+
+    def options(self, i: int) -> list:
+        return [self._string(s) for s in self._options[self._option_starts[i]:self._option_starts[i + 1]]]
+
+    def correct_option(self, i: int) -> str:
+        return self._string(self._options[self._option_starts[i] + self._correct[i]])
+
+    def id_positions(self) -> dict:
+        """Dizionario id -> posizione, costruito al primo uso (correzione in blocco)"""
+        if self._id_index is None:
+            self._id_index = dict(zip(self._ids, range(len(self._ids))))
+        return self._id_index
+
+    def answer_key(self) -> list:
+        """Testo dell'opzione corretta per posizione, costruito al primo uso (correzione in blocco)"""
+        if self._answer_key is None:
+            self._answer_key = [self.correct_option(i) for i in range(len(self._ids))]
+        return self._answer_key
+
+    def comment(self, i: int) -> Optional[str]:
+        string_id = self._comments[i]
+        return self._string(string_id) if string_id >= 0 else None
+
+    def question(self, i: int) -> dict:
+        """Domanda nel formato del parser (opzioni non mescolate)"""
+        return {
+            "id": self._ids[i],
+            "question": self.text(i),
+            "options": self.options(i),
+            "correct": self._correct[i],
+            "comment": self.comment(i)
+        }
+
+    def questions(self) -> list:
+        return [self.question(i) for i in range(len(self))]
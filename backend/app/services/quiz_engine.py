@@ -0,0 +1,166 @@
+import operator
+from itertools import accumulate, chain
+from typing import Optional
+
+# Punteggi per risposta
+SCORE_CORRECT = 1
+SCORE_WRONG = -0.33
+SCORE_BLANK = 0
+
+# Esiti salvati nel log delle risposte
+OUTCOME_CORRECT = 1
+OUTCOME_BLANK = 0
+OUTCOME_WRONG = -1
+
+# (corretta, non risposta) -> esito
+_OUTCOMES = {
+    (True, False): OUTCOME_CORRECT,
+    (False, False): OUTCOME_WRONG,
+    (False, True): OUTCOME_BLANK,
+    (True, True): OUTCOME_BLANK,
+}
+
+_SCORES = {OUTCOME_CORRECT: SCORE_CORRECT, OUTCOME_WRONG: SCORE_WRONG, OUTCOME_BLANK: SCORE_BLANK}
+
+class UnknownQuestionError(Exception):
+    """La domanda inviata non appartiene al quiz"""
+
+def _position(bank, question_id: Optional[int], question_text: Optional[str]) -> int:
+    i = bank.position(question_id) if question_id is not None else bank.position_by_text(question_text)
+    if i is None:
+        raise UnknownQuestionError(question_id if question_id is not None else question_text)
+    return i
+
+def _summary(total_questions: int, correct_answers: int, wrong_answers: int, no_answers: int, total_score) -> dict:
+    max_score = total_questions
+    return {
+        "total_questions": total_questions,
+        "correct_answers": correct_answers,
+        "wrong_answers": wrong_answers,
+        "no_answers": no_answers,
+        "total_score": total_score,
+        "max_score": max_score,
+        "score_percentage": round((total_score / max_score) * 100, 2) if max_score else 0.0
+    }
+
+def grade_answers(bank, answers: list, details: bool = True, outcomes: Optional[list] = None) -> dict:
+    """
+    Valuta una lista di (id domanda, testo domanda, risposta) su un QuestionBank.
+    Se l'id è presente la domanda si trova per id, altrimenti per testo (client precedenti).
+    Con details=False il risultato non include l'esito per domanda.
+    Se `outcomes` è una lista vi si aggiungono le coppie (id domanda, esito).
+    """
+    total_questions = len(answers)
+    total_score = 0
+    correct_answers = 0
+    wrong_answers = 0
+    no_answers = 0
+    results = []
+
+    for question_id, question_text, user_answer in answers:
+        i = _position(bank, question_id, question_text)
+        correct_option = bank.correct_option(i)
+
+        # Calcolo punteggio
+        is_correct = user_answer == correct_option
+        if user_answer == "":
+            score = SCORE_BLANK  # non risposta
+            outcome = OUTCOME_BLANK
+            no_answers += 1
+        elif is_correct:
+            score = SCORE_CORRECT  # risposta corretta
+            outcome = OUTCOME_CORRECT
+            correct_answers += 1
+        else:
+            score = SCORE_WRONG  # risposta sbagliata
+            outcome = OUTCOME_WRONG
+            wrong_answers += 1
+
+        if outcomes is not None:
+            outcomes.append((bank.question_id(i), outcome))
+
+        total_score += score
+
+        if details:
+            results.append({
+                "id": bank.question_id(i),
+                "question": bank.text(i),
+                "your_answer": user_answer,
+                "correct_answer": correct_option,
+                "is_correct": is_correct,
+                "score": score,
+                "comment": bank.comment(i)
+            })
+
+    graded = _summary(total_questions, correct_answers, wrong_answers, no_answers, total_score)
+    if details:
+        graded["results"] = results
+    return graded
+
+def grade_batch(bank, submissions: list, details: bool = False) -> list:
+    """
+    Valuta più consegne sullo stesso QuestionBank in un'unica passata.
+    `submissions` è una lista di liste (id domanda, testo domanda, risposta) come per
+    grade_answers. Le risposte di tutto il batch sono messe in fila e confrontate con la
+    chiave delle risposte (costruita una volta per file) con map/accumulate, senza un
+    ciclo Python per risposta; i totali di ogni consegna sono differenze delle somme cumulative.
+    Ritorna, per consegna, (graded, [(id domanda, esito), ...]) oppure None se contiene
+    una domanda che non appartiene al quiz.
+    """
+    flat = list(chain.from_iterable(submissions))
+    ends = list(accumulate(map(len, submissions)))
+    ids, texts, answers = zip(*flat) if flat else ((), (), ())
+
+    # Posizioni per id con un dizionario; il testo solo per i client che non inviano l'id
+    positions = list(map(bank.id_positions().get, ids))
+    question_ids = list(ids)
+    if None in positions:
+        for j in [j for j, i in enumerate(positions) if i is None]:
+            if ids[j] is None:
+                positions[j] = bank.position_by_text(texts[j])
+                if positions[j] is not None:
+                    question_ids[j] = bank.question_id(positions[j])
+
+    bounds = []
+    for start, end in zip([0, *ends], ends):
+        if None in positions[start:end]:
+            # Domanda che non appartiene al quiz: la consegna è scartata
+            positions[start:end] = [0] * (end - start)
+            bounds.append(None)
+        else:
+            bounds.append((start, end))
+
+    key = bank.answer_key()
+    correct_options = list(map(key.__getitem__, positions))
+    is_correct = list(map(operator.eq, answers, correct_options))
+    is_blank = list(map(operator.not_, answers))
+    outcomes = list(map(_OUTCOMES.__getitem__, zip(is_correct, is_blank)))
+    correct_totals = [0, *accumulate(map(operator.and_, is_correct, map(operator.not_, is_blank)))]
+    blank_totals = [0, *accumulate(is_blank)]
+
+    graded = []
+    for bound in bounds:
+        if bound is None:
+            graded.append(None)
+            continue
+        start, end = bound
+        correct_answers = correct_totals[end] - correct_totals[start]
+        no_answers = blank_totals[end] - blank_totals[start]
+        wrong_answers = end - start - correct_answers - no_answers
+        total_score = correct_answers * SCORE_CORRECT + wrong_answers * SCORE_WRONG + no_answers * SCORE_BLANK
+        result = _summary(end - start, correct_answers, wrong_answers, no_answers, total_score)
+        if details:
+            result["results"] = [
+                {
+                    "id": question_ids[j],
+                    "question": bank.text(positions[j]),
+                    "your_answer": answers[j],
+                    "correct_answer": correct_options[j],
+                    "is_correct": is_correct[j],
+                    "score": _SCORES[outcomes[j]],
+                    "comment": bank.comment(positions[j])
+                }
+                for j in range(start, end)
+            ]
+        graded.append((result, list(zip(question_ids[start:end], outcomes[start:end]))))
+    return graded
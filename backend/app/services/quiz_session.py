@@ -0,0 +1,110 @@
+import base64
+import os
+import random
+import secrets
+from array import array
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from jose import JWTError, jwt
+from app.services.auth import SECRET_KEY, ALGORITHM
+
+QUIZ_SESSION_HOURS = int(os.getenv("QUIZ_SESSION_HOURS", "24"))
+SESSION_TYPE = "quiz"
+
+class QuizSession(NamedTuple):
+    quiz_id: Optional[str]  # None per i quiz per argomento
+    seed: int
+    question_ids: list  # id delle domande nell'ordine servito
+    # Solo quiz per argomento: (id file, id domanda) di ogni domanda servita, che ha id n + 1
+    sources: Optional[list] = None
+
+def new_seed() -> int:
+    return secrets.randbits(63)
+
+def session_rng(seed: int) -> random.Random:
+    """Generatore per la scelta (e l'ordine) delle domande"""
+    return random.Random(seed)
+
+def question_rng(seed: int, question_id: int) -> random.Random:
+    """Generatore per l'ordine delle opzioni di una singola domanda"""
+    return random.Random(f"{seed}:{question_id}")
+
+def option_order(seed: int, question_id: int, n_options: int) -> list:
+    """Indici originali delle opzioni nell'ordine mostrato (stessa permutazione di shuffle_question)"""
+    order = list(range(n_options))
+    question_rng(seed, question_id).shuffle(order)
+    return order
+
+def _pack_ids(question_ids: list) -> str:
+    return base64.urlsafe_b64encode(array("I", question_ids).tobytes()).rstrip(b"=").decode()
+
+def _unpack_ids(packed: str) -> list:
+    data = base64.urlsafe_b64decode(packed + "=" * (-len(packed) % 4))
+    ids = array("I")
+    ids.frombytes(data)
+    return ids.tolist()
+
+def issue_session_token(quiz_id: str, seed: int, question_ids: list) -> str:
+    """Token firmato con tutto il necessario per rigenerare il quiz servito"""
+    payload = {
+        "typ": SESSION_TYPE,
+        "q": quiz_id,
+        "s": seed,
+        "i": _pack_ids(question_ids),
+        "exp": datetime.utcnow() + timedelta(hours=QUIZ_SESSION_HOURS)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+def issue_topic_session_token(seed: int, refs: list) -> str:
+    """Come issue_session_token, per domande da più file: refs = [(id file, id domanda), ...]"""
+    payload = {
+        "typ": SESSION_TYPE,
+        "q": None,
+        "s": seed,
+        "f": _pack_ids([file_id for file_id, _ in refs]),
+        "i": _pack_ids([question_id for _, question_id in refs]),
+        "exp": datetime.utcnow() + timedelta(hours=QUIZ_SESSION_HOURS)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+def read_session_token(token: str) -> Optional[QuizSession]:
+    """Ritorna la sessione se firma e scadenza sono valide, altrimenti None"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("typ") != SESSION_TYPE:
+            return None
+        if "f" in payload:
+            refs = list(zip(_unpack_ids(payload["f"]), _unpack_ids(payload["i"])))
+            return QuizSession(None, int(payload["s"]), list(range(1, len(refs) + 1)), refs)
+        return QuizSession(payload["q"], int(payload["s"]), _unpack_ids(payload["i"]))
+    except (JWTError, KeyError, ValueError, TypeError):
+        return None
+
+def session_answers(bank, session: QuizSession, answers: list) -> list:
+    """
+    Associa le risposte (id, testo risposta, indice opzione mostrata), nell'ordine servito,
+    alle domande della sessione. Le domande senza risposta contano come non risposte.
+    Ritorna le tuple (id, testo, risposta) per grade_answers; ValueError se non coerenti.
+    """
+    if len(answers) > len(session.question_ids):
+        raise ValueError("More answers than questions in session")
+
+    resolved = []
+    for n, question_id in enumerate(session.question_ids):
+        user_answer = ""
+        if n < len(answers):
+            answer_id, answer_text, choice = answers[n]
+            if answer_id is not None and answer_id != question_id:
+                raise ValueError("Answer does not match session question")
+            if choice is not None:
+                i = bank.position(question_id)
+                if i is None:
+                    raise ValueError("Question not found in quiz")
+                options = bank.options(i)
+                if not 0 <= choice < len(options):
+                    raise ValueError("Invalid choice")
+                user_answer = options[option_order(session.seed, question_id, len(options))[choice]]
+            else:
+                user_answer = answer_text
+        resolved.append((question_id, None, user_answer))
+    return resolved
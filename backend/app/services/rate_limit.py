@@ -0,0 +1,97 @@
+import math
+import os
+import time
+from app.utils.cache import LRUCache
+
+# Tentativi di login ammessi per finestra, per IP e per username
+LOGIN_IP_LIMIT = int(os.getenv("LOGIN_IP_LIMIT", "30"))
+LOGIN_USER_LIMIT = int(os.getenv("LOGIN_USER_LIMIT", "10"))
+LOGIN_WINDOW = int(os.getenv("LOGIN_WINDOW", "60"))  # secondi
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+class MemoryRateLimiter:
+    """
+    Sliding window a due contatori per chiave, in memoria del processo: il conteggio
+    stimato è quello della finestra corrente più la quota residua della precedente.
+    Memoria costante per chiave; le chiavi inattive scadono dalla cache LRU.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self._max_keys = max_keys
+        self._windows = LRUCache(max_keys)
+
+    async def hit(self, key: str, limit: int, window: int) -> float:
+        """
+        Registra un tentativo per `key`. Ritorna 0 se ammesso, altrimenti i secondi
+        dopo cui riprovare (il tentativo respinto non viene contato).
+        """
+        now = time.monotonic()
+        current_start = now - now % window
+        state = self._windows.get(key)
+        if state is None or state[0] < current_start - window:
+            state = [current_start, 0, 0]  # inizio finestra, conteggio precedente, corrente
+        elif state[0] < current_start:
+            state = [current_start, state[2], 0]
+
+        elapsed = (now - current_start) / window
+        previous, current = state[1], state[2]
+        if previous * (1 - elapsed) + current >= limit:
+            self._windows.put(key, state)
+            if current >= limit:
+                # Serve la finestra successiva, in cui i tentativi di questa pesano
+                # current * (1 - elapsed'): sotto il limite dopo (1 - limit / current) finestre
+                retry_at = current_start + window * (2 - limit / current)
+            else:
+                # Basta che il peso residuo della finestra precedente scenda sotto limit - current
+                retry_at = current_start + window * (1 - (limit - current) / previous)
+            return max(retry_at - now, 1.0)
+
+        state[2] += 1
+        self._windows.put(key, state)
+        return 0.0
+
+    async def refund(self, key: str):
+        """Annulla un tentativo ammesso da hit (dalla finestra corrente se c'è, altrimenti dalla precedente)"""
+        state = self._windows.get(key)
+        if state is None:
+            return
+        if state[2]:
+            state[2] -= 1
+        elif state[1]:
+            state[1] -= 1
+
+    async def reset(self, key: str):
+        self._windows.pop(key)
+
+    def clear(self):
+        self._windows = LRUCache(self._max_keys)
+
+_limiter = MemoryRateLimiter()
+
+def set_rate_limiter(limiter):
+    """
+    Sostituisce il backend (qualsiasi oggetto con `async hit(key, limit, window)`,
+    `async refund(key)` e `async reset(key)`), ad esempio uno condiviso tra worker.
+    """
+    global _limiter
+    _limiter = limiter
+
+async def check_login_allowed(ip: str, username: str) -> int:
+    """
+    Da chiamare prima di toccare database o bcrypt.
+    Ritorna 0 se il tentativo è ammesso, altrimenti i secondi di attesa (interi).
+    """
+    retry_after = await _limiter.hit(f"login:ip:{ip}", LOGIN_IP_LIMIT, LOGIN_WINDOW)
+    if not retry_after:
+        # Username troncato: chiavi di dimensione limitata anche con input arbitrari
+        retry_after = await _limiter.hit(f"login:user:{username[:64]}", LOGIN_USER_LIMIT, LOGIN_WINDOW)
+    return math.ceil(retry_after)
+
+async def login_succeeded(ip: str, username: str):
+    """
+    Dopo un login riuscito i tentativi sullo username ripartono da zero e quello
+    dell'IP non conta: il limite per IP pesa solo sui login falliti, così una classe
+    dietro lo stesso NAT può entrare tutta insieme.
+    """
+    await _limiter.refund(f"login:ip:{ip}")
+    await _limiter.reset(f"login:user:{username[:64]}")
@@ -0,0 +1,276 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from sqlalchemy import func, insert, literal_column, select
+from sqlalchemy.orm import Session
+from app.models.library import QuizFile, QuestionDocument
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory")  # memory | postgres
+SEARCH_SYNC_INTERVAL = float(os.getenv("SEARCH_SYNC_INTERVAL", "5"))  # secondi tra due letture dei documenti nuovi
+# Finestra (secondi) in cui un id già superato può ancora comparire per un commit ritardato
+SEARCH_SYNC_LOOKBACK = float(os.getenv("SEARCH_SYNC_LOOKBACK", "300"))
+# Caricamento dell'indice all'avvio di ogni worker (solo con SEARCH_BACKEND=memory)
+SEARCH_WARMUP = os.getenv("SEARCH_WARMUP", "1") == "1"
+# Tentativi casuali per domanda richiesta prima di passare all'intersezione completa
+SEARCH_PROBES = 8
+# Deve coincidere con la configurazione dell'indice ix_question_documents_tsv
+SEARCH_TS_CONFIG = literal_column("'italian'")
+
+WORD_RE = re.compile(r"\w+")
+COMBINING_RE = re.compile(r"[\u0300-\u036f]")  # accenti separati dalla normalizzazione NFKD
+STOPWORDS = frozenset(
+    "che chi con del dei della delle dello degli dal dalla dalle nel nella nelle nei negli "
+    "sul sulla sulle sui per tra fra una uno gli non più piu come anche sono essere questo "
+    "questa quale quali quando dove cosa the and for with".split()
+)
+
+def _stem(word: str) -> str:
+    # Normalizzazione leggera: senza la vocale finale singolare/plurale coincidono
+    return word[:-1] if len(word) > 4 and word[-1] in "aeio" else word
+
+def normalize_terms(text: str) -> list:
+    """Termini indicizzabili: minuscolo, senza accenti, senza stopword e parole corte"""
+    text = COMBINING_RE.sub("", unicodedata.normalize("NFKD", text.lower()))
+    return [
+        _stem(word) for word in WORD_RE.findall(text)
+        if len(word) >= 3 and word not in STOPWORDS and not word.isdigit()
+    ]
+
+def question_content(q: dict) -> str:
+    return "\n".join([q["question"], *q["options"], q.get("comment") or ""])
+
+class SearchIndex:
+    """
+    Indice invertito in memoria: termine -> posizioni (array di interi crescenti)
+    dei documenti. Per ogni documento si tengono solo file e numero di esercizio.
+    Le ricerche non prendono il lock: gli array crescono solo in coda, e un documento
+    compare nelle posting list solo dopo essere stato aggiunto a file e esercizi.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._files = array("L")
+        self._questions = array("L")
+        # I documenti di un file sono scritti in un'unica transazione: visibili tutti o nessuno
+        self._indexed_files = set()
+        self._scan_from = 0  # id sotto cui non possono più comparire commit nuovi
+        self._marks = deque()  # (istante, id massimo visto) delle sincronizzazioni recenti
+        self._synced_at = None
+        self._stale = True
+        self._lock = threading.Lock()  # un solo aggiornamento alla volta
+
+    def __len__(self):
+        return len(self._files)
+
+    def _add(self, file_id: int, question_id: int, content: str):
+        position = len(self._files)
+        self._files.append(file_id)
+        self._questions.append(question_id)
+        for term in set(normalize_terms(content)):
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array("L")
+            postings.append(position)
+
+    def mark_stale(self):
+        """Nuovi documenti scritti da questo processo: la prossima ricerca li carica subito"""
+        self._stale = True
+
+    def _new_files(self, db: Session) -> tuple:
+        """File con documenti nella finestra di id riletta e non ancora indicizzati, e id massimo"""
+        rows = db.execute(
+            select(QuestionDocument.quiz_file_id, func.max(QuestionDocument.id))
+            .where(QuestionDocument.id > self._scan_from)
+            .group_by(QuestionDocument.quiz_file_id)
+        ).all()
+        max_id = max((max_id for _, max_id in rows), default=self._scan_from)
+        return [file_id for file_id, _ in rows if file_id not in self._indexed_files], max_id
+
+    def _load(self, db: Session, file_ids: list):
+        query = select(
+            QuestionDocument.quiz_file_id, QuestionDocument.question_id, QuestionDocument.content
+        ).order_by(QuestionDocument.id)
+        if self._indexed_files:
+            batches = [file_ids[i:i + 500] for i in range(0, len(file_ids), 500)]
+            queries = [query.where(QuestionDocument.quiz_file_id.in_(batch)) for batch in batches]
+        else:
+            # Primo caricamento: una sola lettura sequenziale della tabella
+            queries = [query.where(QuestionDocument.id > self._scan_from)]
+        for q in queries:
+            for file_id, question_id, content in db.execute(q.execution_options(yield_per=5000)):
+                self._add(file_id, question_id, content)
+                # Anche i file arrivati tra le due letture: non vanno ricaricati
+                self._indexed_files.add(file_id)
+
+    def sync(self, db: Session, force: bool = False):
+        """
+        Aggiornamento incrementale, al più ogni SEARCH_SYNC_INTERVAL, dei file scritti anche
+        da altri worker. I commit concorrenti possono rendere visibili id più bassi dopo
+        id più alti: a ogni lettura si riguarda la finestra di id degli ultimi
+        SEARCH_SYNC_LOOKBACK secondi e si caricano solo i file non ancora indicizzati.
+        Se un altro thread sta già aggiornando l'indice la ricerca non aspetta.
+        """
+        now = time.monotonic()
+        if not (force or self._stale) and self._synced_at is not None and now - self._synced_at < SEARCH_SYNC_INTERVAL:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._stale = False
+            self._synced_at = now
+            file_ids, max_id = self._new_files(db)
+            if file_ids:
+                self._load(db, file_ids)
+            self._marks.append((now, max_id))
+            while self._marks and now - self._marks[0][0] >= SEARCH_SYNC_LOOKBACK:
+                self._scan_from = self._marks.popleft()[1]
+        finally:
+            self._lock.release()
+
+    def sample(self, terms: list, k: int, rng) -> list:
+        """
+        Fino a k documenti (file, esercizio), scelti a caso tra quelli che contengono
+        tutti i termini, senza costruire l'intera lista dei risultati.
+        """
+        postings = [self._postings.get(term) for term in set(terms)]
+        if not postings or any(p is None for p in postings):
+            return []
+        postings.sort(key=len)
+        first, rest = postings[0], postings[1:]
+        n = len(first)
+
+        if not rest:
+            positions = [first[i] for i in rng.sample(range(n), min(k, n))]
+        else:
+            # Campionamento per rifiuto: posizioni casuali della lista più corta, tenute se
+            # presenti (ricerca binaria) in tutte le altre
+            positions = []
+            tried = set()
+            budget = min(n, SEARCH_PROBES * k)
+            while len(positions) < k and len(tried) < budget:
+                i = rng.randrange(n)
+                if i in tried:
+                    continue
+                tried.add(i)
+                if all(_contains(p, first[i]) for p in rest):
+                    positions.append(first[i])
+            if len(positions) < k and budget < n:
+                # Termini che compaiono poco insieme: intersezione completa delle liste ordinate
+                matches = _intersect(first, rest)
+                positions = rng.sample(matches, min(k, len(matches)))
+        return [(self._files[i], self._questions[i]) for i in positions]
+
+def _contains(postings: array, position: int) -> bool:
+    i = bisect_left(postings, position)
+    return i < len(postings) and postings[i] == position
+
+def _intersect(first: array, rest: list) -> list:
+    """Intersezione di liste ordinate: ogni lista è prima ristretta alla finestra [min, max] corrente"""
+    matches = first
+    for p in rest:
+        lo = bisect_left(p, matches[0])
+        hi = bisect_right(p, matches[-1])
+        window = p[lo:hi]
+        # Insieme costruito sulla più corta, l'altra è solo scorsa (entrambe le cose in C)
+        short, long = (matches, window) if len(matches) <= len(window) else (window, matches)
+        matches = sorted(set(short).intersection(long))
+        if not matches:
+            return []
+    return list(matches)
+
+search_index = SearchIndex()
+
+def warm_search_index():
+    """Primo caricamento dell'indice all'avvio del worker (in un thread, fuori dalle richieste)"""
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        search_index.sync(db, force=True)
+        logger.info("Search index ready: %d questions", len(search_index))
+    except Exception:
+        logger.exception("Search index warm-up failed")
+    finally:
+        db.close()
+
+def add_documents(db: Session, quiz_file_id: int, questions: list):
+    """
+    Scrive i documenti di un file appena salvato o parsato con un unico insert bulk
+    (executemany, senza oggetti ORM); il commit resta al chiamante.
+    """
+    if not questions:
+        return
+    db.execute(insert(QuestionDocument), [
+        {
+            "quiz_file_id": quiz_file_id,
+            "question_id": q.get("id") or position + 1,
+            "content": question_content(q)
+        }
+        for position, q in enumerate(questions)
+    ])
+    search_index.mark_stale()
+
+def _search_postgres(db: Session, query: str, k: int) -> list:
+    tsquery = func.plainto_tsquery(SEARCH_TS_CONFIG, query)
+    return [tuple(row) for row in db.execute(
+        select(QuestionDocument.quiz_file_id, QuestionDocument.question_id)
+        .where(func.to_tsvector(SEARCH_TS_CONFIG, QuestionDocument.content).op("@@")(tsquery))
+        .order_by(func.random())
+        .limit(k)
+    )]
+
+def search_questions(db: Session, query: str, k: int, rng) -> list:
+    """
+    Fino a k domande (file, esercizio), scelte a caso tra quelle che contengono
+    tutte le parole della ricerca, da tutti i file della libreria.
+    """
+    if SEARCH_BACKEND == "postgres":
+        return _search_postgres(db, query, k)
+
+    terms = normalize_terms(query)
+    if not terms:
+        return []
+    search_index.sync(db)
+    return search_index.sample(terms, k, rng)
+
+def backfill_documents(db: Session) -> int:
+    """Crea i documenti mancanti per i file già in libreria (già parsati)"""
+    indexed = select(QuestionDocument.quiz_file_id).distinct()
+    files = db.query(QuizFile.id, QuizFile.questions).filter(
+        QuizFile.questions.is_not(None),
+        QuizFile.id.not_in(indexed)
+    ).yield_per(100)
+    count = 0
+    for file_id, questions in files:
+        # Con alcuni dialetti il JSON null non è un NULL SQL: i file lazy arrivano fin qui
+        if not questions:
+            continue
+        add_documents(db, file_id, questions)
+        count += 1
+    return count
+
+if __name__ == "__main__":
+    # Backfill: python -m app.services.search rebuild
+    from app.database import SessionLocal, engine
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python -m app.services.search rebuild")
+        sys.exit(1)
+
+    QuestionDocument.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        count = backfill_documents(db)
+        db.commit()
+        print(f"Indexed {count} quiz files")
+    finally:
+        db.close()
@@ -0,0 +1,240 @@
+import sys
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.database import upsert_insert
+from app.models.user import QuizStat, UserStatsAggregate, QuizAttemptCounter
+
+def _aggregate_columns():
+    return (
+        func.count(QuizStat.id),
+        func.coalesce(func.sum(QuizStat.score), 0.0),
+        func.coalesce(func.sum(QuizStat.correct_answers), 0),
+        func.coalesce(func.sum(QuizStat.wrong_answers), 0),
+        func.coalesce(func.sum(QuizStat.no_answers), 0),
+        func.coalesce(func.sum(QuizStat.time_spent), 0),
+        func.max(QuizStat.completed_at),
+    )
+
+def _make_aggregate(user_id: int, row) -> UserStatsAggregate:
+    return UserStatsAggregate(
+        user_id=user_id,
+        total_quizzes=row[0],
+        total_score=row[1],
+        total_correct=row[2],
+        total_wrong=row[3],
+        total_unanswered=row[4],
+        total_time_spent=row[5],
+        last_activity=row[6]
+    )
+
+def _user_aggregate_select(user_id: int):
+    return select(*_aggregate_columns()).where(QuizStat.user_id == user_id)
+
+def compute_user_aggregate(db: Session, user_id: int) -> UserStatsAggregate:
+    """Ricalcola i totali di un utente da quiz_stats con una sola query aggregata"""
+    row = db.execute(_user_aggregate_select(user_id)).one()
+    return _make_aggregate(user_id, row)
+
+def _insert_aggregate(db: Session, aggregate: UserStatsAggregate) -> bool:
+    """Inserisce la riga in un savepoint; False se un'altra transazione l'ha già creata"""
+    try:
+        with db.begin_nested():
+            db.add(aggregate)
+        return True
+    except IntegrityError:
+        return False
+
+def next_attempt_number(db: Session, user_id: int, quiz_name: str) -> int:
+    """
+    Incrementa il contatore (utente, quiz) e ritorna il nuovo numero di tentativo.
+    Il commit resta al chiamante.
+    """
+    increment = (
+        update(QuizAttemptCounter)
+        .where(QuizAttemptCounter.user_id == user_id, QuizAttemptCounter.quiz_name == quiz_name)
+        .values(attempts=QuizAttemptCounter.attempts + 1)
+        .returning(QuizAttemptCounter.attempts)
+    )
+    attempts = db.execute(increment).scalar()
+    if attempts is not None:
+        return attempts
+
+    # Primo tentativo registrato col contatore: si parte dai tentativi già in quiz_stats
+    previous = db.query(func.count(QuizStat.id)).filter(
+        QuizStat.user_id == user_id,
+        QuizStat.quiz_name == quiz_name
+    ).scalar()
+    try:
+        with db.begin_nested():
+            db.add(QuizAttemptCounter(user_id=user_id, quiz_name=quiz_name, attempts=previous + 1))
+        return previous + 1
+    except IntegrityError:
+        return db.execute(increment).scalar()
+
+def record_attempt(db: Session, stat: QuizStat):
+    """
+    Aggiorna i totali dell'utente nella stessa transazione del nuovo QuizStat.
+    Il commit resta al chiamante.
+    """
+    db.add(stat)
+    db.flush()
+
+    increments = {
+        UserStatsAggregate.total_quizzes: UserStatsAggregate.total_quizzes + 1,
+        UserStatsAggregate.total_score: UserStatsAggregate.total_score + stat.score,
+        UserStatsAggregate.total_correct: UserStatsAggregate.total_correct + stat.correct_answers,
+        UserStatsAggregate.total_wrong: UserStatsAggregate.total_wrong + stat.wrong_answers,
+        UserStatsAggregate.total_unanswered: UserStatsAggregate.total_unanswered + stat.no_answers,
+        UserStatsAggregate.total_time_spent: UserStatsAggregate.total_time_spent + stat.time_spent,
+        UserStatsAggregate.last_activity: stat.completed_at,
+    }
+    query = db.query(UserStatsAggregate).filter(UserStatsAggregate.user_id == stat.user_id)
+    if query.update(increments, synchronize_session=False):
+        return
+
+    # Prima volta (o utente precedente all'introduzione della tabella):
+    # la riga si calcola da quiz_stats, che include già il tentativo appena inserito
+    if not _insert_aggregate(db, compute_user_aggregate(db, stat.user_id)):
+        query.update(increments, synchronize_session=False)
+
+def record_attempts(db: Session, rows: list):
+    """
+    Versione bulk di record_attempt per le righe di quiz_stats appena inserite (dict):
+    un solo UPDATE incrementale (executemany) per gli utenti che hanno già i totali,
+    senza rileggere lo storico. Il commit resta al chiamante.
+    """
+    increments = {}
+    for row in rows:
+        totals = increments.setdefault(row["user_id"], {
+            "b_user_id": row["user_id"], "quizzes": 0, "score": 0.0, "correct": 0,
+            "wrong": 0, "unanswered": 0, "time_spent": 0, "last_activity": row["completed_at"]
+        })
+        totals["quizzes"] += 1
+        totals["score"] += row["score"]
+        totals["correct"] += row["correct_answers"]
+        totals["wrong"] += row["wrong_answers"]
+        totals["unanswered"] += row["no_answers"]
+        totals["time_spent"] += row["time_spent"]
+        totals["last_activity"] = max(totals["last_activity"], row["completed_at"])
+
+    # Le righe non vengono mai cancellate fuori dal rebuild: esistenti ora, esistenti all'UPDATE
+    existing = set(db.scalars(
+        select(UserStatsAggregate.user_id).where(UserStatsAggregate.user_id.in_(list(increments)))
+    ))
+    table = UserStatsAggregate.__table__
+    increment = update(table).where(table.c.user_id == bindparam("b_user_id")).values(
+        total_quizzes=table.c.total_quizzes + bindparam("quizzes"),
+        total_score=table.c.total_score + bindparam("score"),
+        total_correct=table.c.total_correct + bindparam("correct"),
+        total_wrong=table.c.total_wrong + bindparam("wrong"),
+        total_unanswered=table.c.total_unanswered + bindparam("unanswered"),
+        total_time_spent=table.c.total_time_spent + bindparam("time_spent"),
+        last_activity=bindparam("last_activity"),
+    )
+    updates = [increments[user_id] for user_id in sorted(existing)]
+    if updates:
+        db.execute(increment, updates)
+
+    # Utenti senza totali (primo tentativo o precedenti alla tabella): come in record_attempt
+    for user_id in sorted(increments.keys() - existing):
+        if not _insert_aggregate(db, compute_user_aggregate(db, user_id)):
+            db.execute(increment, [increments[user_id]])
+
+async def get_user_aggregate(db: AsyncSession, user_id: int) -> UserStatsAggregate:
+    """Lookup per chiave primaria; se la riga manca viene ricostruita e salvata"""
+    aggregate = await db.get(UserStatsAggregate, user_id)
+    if aggregate is not None:
+        return aggregate
+
+    row = (await db.execute(_user_aggregate_select(user_id))).one()
+    aggregate = _make_aggregate(user_id, row)
+    try:
+        async with db.begin_nested():
+            db.add(aggregate)
+    except IntegrityError:
+        # Creata nel frattempo da un submit concorrente
+        return await db.get(UserStatsAggregate, user_id)
+    await db.commit()
+    return aggregate
+
+def reserve_attempt_numbers(db: Session, user_counts: dict, quiz_name: str) -> dict:
+    """
+    Versione bulk di next_attempt_number: per ogni user_id riserva `count` tentativi
+    e ritorna {user_id: primo numero di tentativo}. Il commit resta al chiamante.
+    Due statement atomici, senza letture seguite da scritture: i submit concorrenti
+    si mettono in coda sulla riga del contatore invece di fallire con IntegrityError.
+    """
+    user_ids = sorted(user_counts)  # righe bloccate sempre nello stesso ordine
+    existing = set(db.scalars(
+        select(QuizAttemptCounter.user_id).where(
+            QuizAttemptCounter.user_id.in_(user_ids),
+            QuizAttemptCounter.quiz_name == quiz_name
+        )
+    ))
+
+    # Contatori mancanti: si parte dai tentativi già in quiz_stats. Se un submit concorrente
+    # crea la riga nel frattempo la sua vince (stesso punto di partenza)
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    if missing:
+        previous = dict(
+            db.query(QuizStat.user_id, func.count(QuizStat.id))
+            .filter(QuizStat.user_id.in_(missing), QuizStat.quiz_name == quiz_name)
+            .group_by(QuizStat.user_id)
+            .all()
+        )
+        seed = upsert_insert(db, QuizAttemptCounter).on_conflict_do_nothing(
+            index_elements=[QuizAttemptCounter.user_id, QuizAttemptCounter.quiz_name]
+        )
+        db.execute(seed, [
+            {"user_id": user_id, "quiz_name": quiz_name, "attempts": previous.get(user_id, 0)}
+            for user_id in missing
+        ])
+
+    increment = upsert_insert(db, QuizAttemptCounter)
+    increment = increment.on_conflict_do_update(
+        index_elements=[QuizAttemptCounter.user_id, QuizAttemptCounter.quiz_name],
+        set_={"attempts": QuizAttemptCounter.attempts + increment.excluded.attempts}
+    ).returning(QuizAttemptCounter.user_id, QuizAttemptCounter.attempts)
+    reserved = db.execute(increment, [
+        {"user_id": user_id, "quiz_name": quiz_name, "attempts": user_counts[user_id]}
+        for user_id in user_ids
+    ]).all()
+    return {user_id: attempts - user_counts[user_id] + 1 for user_id, attempts in reserved}
+
+def refresh_aggregates(db: Session, user_ids=None) -> int:
+    """
+    Ricalcola da quiz_stats i totali degli utenti indicati (tutti se None):
+    una query raggruppata, una DELETE e un insert bulk. Il commit resta al chiamante.
+    """
+    query = db.query(QuizStat.user_id, *_aggregate_columns())
+    delete = db.query(UserStatsAggregate)
+    if user_ids is not None:
+        query = query.filter(QuizStat.user_id.in_(user_ids))
+        delete = delete.filter(UserStatsAggregate.user_id.in_(user_ids))
+    rows = query.group_by(QuizStat.user_id).all()
+    delete.delete(synchronize_session=False)
+    db.add_all([_make_aggregate(row[0], row[1:]) for row in rows])
+    return len(rows)
+
+def rebuild_aggregates(db: Session) -> int:
+    """Ricostruisce tutti i totali da quiz_stats; ritorna il numero di utenti"""
+    count = refresh_aggregates(db)
+    db.commit()
+    return count
+
+if __name__ == "__main__":
+    # Backfill: python -m app.services.stats rebuild
+    from app.database import SessionLocal, engine
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python -m app.services.stats rebuild")
+        sys.exit(1)
+
+    UserStatsAggregate.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        print(f"Rebuilt aggregates for {rebuild_aggregates(db)} users")
+    finally:
+        db.close()
@@ -0,0 +1,86 @@
+import codecs
+import os
+import zipfile
+import zlib
+from typing import NamedTuple, Optional
+
+MAX_ARCHIVE_SIZE = int(os.getenv("MAX_ARCHIVE_SIZE", str(50 * 1024 * 1024)))  # byte compressi
+MAX_ARCHIVE_MEMBERS = int(os.getenv("MAX_ARCHIVE_MEMBERS", "500"))
+MAX_ARCHIVE_UNCOMPRESSED = int(os.getenv("MAX_ARCHIVE_UNCOMPRESSED", str(200 * 1024 * 1024)))
+
+READ_CHUNK_SIZE = 256 * 1024
+
+class ArchiveError(Exception):
+    """Archivio non valido o oltre i limiti: rifiutato per intero"""
+
+class ArchiveMember(NamedTuple):
+    filename: str
+    text: Optional[str]  # None se il file è stato scartato
+    error: Optional[str]
+
+def _member_error(filename: str, allowed: list, blacklisted: list, max_file_size: int, info) -> Optional[str]:
+    if any(filename.endswith(ext) for ext in blacklisted) or not any(filename.endswith(ext) for ext in allowed):
+        return "Only .txt files allowed"
+    if info.flag_bits & 0x1:
+        return "Encrypted files are not supported"
+    if info.file_size > max_file_size:
+        return f"File too large. Maximum size: {max_file_size / 1024 / 1024:.1f} MB"
+    return None
+
+def iter_zip_members(fileobj, allowed: list, blacklisted: list, max_file_size: int):
+    """
+    Legge un archivio zip un membro alla volta, decomprimendo a blocchi in memoria
+    (niente estrazione su disco). Genera un ArchiveMember per ogni file.
+    Le dimensioni dichiarate nell'archivio non sono affidabili: i limiti per file e
+    sul totale decompresso sono verificati sui byte effettivamente letti.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ArchiveError("Invalid zip archive")
+
+    with archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) > MAX_ARCHIVE_MEMBERS:
+            raise ArchiveError(f"Too many files in archive. Maximum: {MAX_ARCHIVE_MEMBERS}")
+
+        total_size = 0
+        for info in members:
+            filename = info.filename
+            # Metadati aggiunti da macOS, non sono file dell'utente
+            if filename.startswith("__MACOSX/") or os.path.basename(filename).startswith("._"):
+                continue
+
+            error = _member_error(filename, allowed, blacklisted, max_file_size, info)
+            if error:
+                yield ArchiveMember(filename, None, error)
+                continue
+
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            parts = []
+            size = 0
+            try:
+                with archive.open(info) as member:
+                    while True:
+                        chunk = member.read(READ_CHUNK_SIZE)
+                        size += len(chunk)
+                        total_size += len(chunk)
+                        if total_size > MAX_ARCHIVE_UNCOMPRESSED:
+                            raise ArchiveError(
+                                f"Archive too large once extracted. Maximum: {MAX_ARCHIVE_UNCOMPRESSED / 1024 / 1024:.1f} MB"
+                            )
+                        if size > max_file_size:
+                            error = f"File too large. Maximum size: {max_file_size / 1024 / 1024:.1f} MB"
+                            break
+                        parts.append(decoder.decode(chunk, final=not chunk))
+                        if not chunk:
+                            break
+            except UnicodeDecodeError:
+                error = "File encoding error: expected UTF-8"
+            except (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, EOFError, NotImplementedError, OSError) as e:
+                error = f"Error reading file: {e}"
+
+            if error:
+                yield ArchiveMember(filename, None, error)
+            else:
+                yield ArchiveMember(filename, "".join(parts), None)
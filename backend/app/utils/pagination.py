@@ -0,0 +1,16 @@
+import base64
+from datetime import datetime
+
+def encode_cursor(completed_at: datetime, row_id: int) -> str:
+    """Cursore opaco per la keyset pagination su (completed_at, id)"""
+    raw = f"{completed_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    """Ritorna (completed_at, id); ValueError se il cursore non è valido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        completed_at, row_id = raw.split("|")
+        return datetime.fromisoformat(completed_at), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
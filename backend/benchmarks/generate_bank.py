@@ -0,0 +1,51 @@
+"""
+Generatore di banche domande sintetiche nel formato UpQuiz.
+
+    python -m benchmarks.generate_bank 1000 --case unicode > bank.txt
+"""
+import argparse
+import random
+
+CASES = ("valid", "long_lines", "missing_answers", "unicode")
+
+WORDS = ["quiz", "domanda", "risposta", "memoria", "processo", "rete", "algoritmo", "grafo", "tabella", "indice"]
+UNICODE_WORDS = ["perché", "città", "übung", "naïve", "σύστημα", "алгоритм", "数据", "🎓", "façade", "ĉapelo"]
+
+def _sentence(rng: random.Random, words: list, length: int) -> str:
+    return " ".join(rng.choice(words) for _ in range(length))
+
+def generate_bank(n: int, case: str = "valid", seed: int = 0) -> str:
+    """
+    Ritorna il testo di n esercizi "Esercizio N." con opzioni A)..D), Risposta e Commento.
+    case:
+      valid            file corretto
+      long_lines       domande e commenti di diversi KB su una sola riga
+      missing_answers  circa un esercizio su dieci senza "Risposta:"
+      unicode          testo con accenti, alfabeti non latini ed emoji
+    """
+    if case not in CASES:
+        raise ValueError(f"Unknown case '{case}', expected one of {CASES}")
+
+    rng = random.Random(seed)
+    words = UNICODE_WORDS if case == "unicode" else WORDS
+    question_len = 800 if case == "long_lines" else 12
+    comment_len = 400 if case == "long_lines" else 8
+
+    parts = []
+    for i in range(1, n + 1):
+        lines = [f"Esercizio {i}.", _sentence(rng, words, question_len) + f" ({i})?"]
+        for letter in "ABCD":
+            lines.append(f"{letter}) {_sentence(rng, words, 4)}")
+        if not (case == "missing_answers" and i % 10 == 0):
+            lines.append(f"Risposta: {rng.choice('ABCD')}")
+        lines.append(f"Commento: {_sentence(rng, words, comment_len)}")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts) + "\n"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic quiz bank")
+    parser.add_argument("questions", type=int)
+    parser.add_argument("--case", choices=CASES, default="valid")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate_bank(args.questions, args.case, args.seed), end="")
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark dei percorsi di parsing e correzione, con output JSON confrontabile tra commit.
+
+    cd backend
+    python -m benchmarks.run --sizes 10,1000,10000 --out bench.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from fastapi import UploadFile
+from app.routes.quiz import validate_file_upload, MAX_FILE_SIZE
+from app.services.question_bank import QuestionBank
+from app.services.parser import parse_quiz_text
+from app.services.quiz_engine import grade_answers, UnknownQuestionError
+from app.services.validator import validate_quiz_file
+from benchmarks.generate_bank import generate_bank, CASES
+
+def _timed(func, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+# Un solo event loop per tutte le ripetizioni: si misura la lettura, non l'avvio del loop
+_loop = asyncio.new_event_loop()
+
+def _upload(data: bytes):
+    file = UploadFile(file=io.BytesIO(data), filename="bank.txt")
+    return _loop.run_until_complete(validate_file_upload(file))
+
+def _grade(text: str):
+    questions = parse_quiz_text(text, shuffle=False)
+    bank = QuestionBank(questions)
+    answers = [(q["id"], q["question"], q["options"][i % len(q["options"])]) for i, q in enumerate(questions)]
+
+    def run():
+        try:
+            grade_answers(bank, answers)
+        except UnknownQuestionError:
+            pass
+    return run
+
+def benchmark_case(size: int, case: str, repeat: int) -> list:
+    text = generate_bank(size, case)
+    data = text.encode("utf-8")
+    targets = {
+        "parse_quiz_text": lambda: parse_quiz_text(text),
+        "validate_quiz_file": lambda: validate_quiz_file(text),
+        "grade_answers": _grade(text),
+    }
+    if len(data) <= MAX_FILE_SIZE:
+        targets["validate_file_upload"] = lambda: _upload(data)
+
+    results = []
+    for name, func in targets.items():
+        timings = _timed(func, repeat)
+        results.append({
+            "name": name,
+            "case": case,
+            "questions": size,
+            "bytes": len(data),
+            "repeat": repeat,
+            "min_ms": round(min(timings), 3),
+            "median_ms": round(statistics.median(timings), 3),
+            "mean_ms": round(statistics.mean(timings), 3),
+        })
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run UpQuiz micro-benchmarks")
+    parser.add_argument("--sizes", default="10,1000,10000", help="comma separated question counts (10..100000)")
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        for case in args.cases.split(","):
+            results.extend(benchmark_case(size, case, args.repeat))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -21,22 +21,30 @@ function AdminDashboard({ onLogout }) {
 		}
 
 		try {
-			const response = await fetch(`${API_BASE}/auth/admin/users`, {
-				headers: {
-					"Authorization": `Bearer ${token}`,
-				},
-			});
+			// Paginated by id: follow X-Next-Cursor until the last page
+			let allUsers = [];
+			let cursor = null;
+			do {
+				const query = cursor ? `?after_id=${cursor}` : "";
+				const response = await fetch(`${API_BASE}/auth/admin/users${query}`, {
+					headers: {
+						"Authorization": `Bearer ${token}`,
+					},
+				});
 
-			if (!response.ok) {
-				if (response.status === 403) {
-					setError("Admin access required");
-					return;
+				if (!response.ok) {
+					if (response.status === 403) {
+						setError("Admin access required");
+						return;
+					}
+					throw new Error("Failed to fetch users");
 				}
-				throw new Error("Failed to fetch users");
-			}
 
-			const data = await response.json();
-			setUsers(data);
+				const data = await response.json();
+				allUsers = allUsers.concat(data);
+				setUsers(allUsers);
+				cursor = response.headers.get("X-Next-Cursor");
+			} while (cursor);
 		} catch (err) {
 			setError(err.message);
 		} finally {
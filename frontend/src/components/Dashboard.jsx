@@ -8,6 +8,8 @@ function Dashboard({ username, onLogout }) {
 	const [isLoading, setIsLoading] = useState(true);
 	const [error, setError] = useState(null);
 	const [showAllHistory, setShowAllHistory] = useState(false);
+	const [nextCursor, setNextCursor] = useState(null);
+	const [isLoadingHistory, setIsLoadingHistory] = useState(false);
 
 	useEffect(() => {
 		fetchStats();
@@ -47,23 +49,29 @@ function Dashboard({ username, onLogout }) {
 		}
 	};
 
-	const fetchHistory = async () => {
+	const fetchHistory = async (cursor = null) => {
 		const token = localStorage.getItem("token");
 		if (!token) return;
 
+		// Paginated: one page per call, the next one only on "Load More"
+		setIsLoadingHistory(true);
 		try {
-			const response = await fetch(`${API_BASE}/auth/history`, {
+			const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+			const response = await fetch(`${API_BASE}/auth/history${query}`, {
 				headers: {
 					"Authorization": `Bearer ${token}`,
 				},
 			});
 
-			if (response.ok) {
-				const data = await response.json();
-				setHistory(data);
-			}
+			if (!response.ok) return;
+
+			const data = await response.json();
+			setHistory((previous) => (cursor ? previous.concat(data) : data));
+			setNextCursor(response.headers.get("X-Next-Cursor"));
 		} catch (err) {
 			console.error("Failed to fetch history:", err);
+		} finally {
+			setIsLoadingHistory(false);
 		}
 	};
 
@@ -143,12 +151,21 @@ function Dashboard({ username, onLogout }) {
 								</div>
 							))}
 						</div>
-						{history.length > 3 && (
+						{showAllHistory && nextCursor && (
+							<button
+								onClick={() => fetchHistory(nextCursor)}
+								className="btn btn-toggle-history"
+								disabled={isLoadingHistory}
+							>
+								{isLoadingHistory ? "Loading..." : "Load More"}
+							</button>
+						)}
+						{(history.length > 3 || nextCursor) && (
 							<button 
 								onClick={() => setShowAllHistory(!showAllHistory)} 
 								className="btn btn-toggle-history"
 							>
-								{showAllHistory ? "Show Less" : `Show All (${history.length} quizzes)`}
+								{showAllHistory ? "Show Less" : `Show All (${stats.total_quizzes} quizzes)`}
 							</button>
 						)}
 					</div>
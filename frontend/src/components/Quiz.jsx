@@ -7,7 +7,8 @@ const API_BASE = "/api";
 
 function Quiz({ username }) {
 const [file, setFile] = useState(null);
-const [fileContent, setFileContent] = useState("");
+const [quizId, setQuizId] = useState(null);
+const [session, setSession] = useState(null);
 const [questions, setQuestions] = useState([]);
 const [answers, setAnswers] = useState({});
 const [result, setResult] = useState(null);
@@ -17,6 +18,7 @@ const [error, setError] = useState(null);
 const [warnings, setWarnings] = useState([]);
 const [showFormatInfo, setShowFormatInfo] = useState(false);
 const [startTime, setStartTime] = useState(null);
+const [weakOnly, setWeakOnly] = useState(false);
 
 useEffect(() => {
   if (result) {
@@ -32,16 +34,8 @@ setAnswers({});
 setResult(null);
 setError(null);
 setWarnings([]);
-
-if (selected) {
-const reader = new FileReader();
-reader.onload = (event) => {
-setFileContent(event.target?.result || "");
-};
-reader.readAsText(selected);
-} else {
-setFileContent("");
-}
+setQuizId(null);
+setSession(null);
 };
 
 const startQuiz = async () => {
@@ -58,8 +52,10 @@ setError(null);
 setWarnings([]);
 setResult(null);
 try {
-const resp = await fetch(`${API_BASE}/quiz/simulate`, {
+const token = localStorage.getItem("token");
+const resp = await fetch(`${API_BASE}/quiz/simulate${weakOnly ? "?weak=true" : ""}`, {
 method: "POST",
+headers: weakOnly && token ? { Authorization: `Bearer ${token}` } : {},
 body: formData,
 });
 if (!resp.ok) {
@@ -68,6 +64,8 @@ throw new Error(detail.detail || `API Error ${resp.status}`);
 }
 const data = await resp.json();
 setQuestions(data.questions || []);
+setQuizId(data.quiz_id || null);
+setSession(data.session || null);
 setAnswers({});
 if (data.warnings && data.warnings.length > 0) {
 setWarnings(data.warnings);
@@ -91,10 +89,12 @@ const timeSpent = startTime ? Math.floor((Date.now() - startTime) / 1000) : 0;
 const token = localStorage.getItem("token");
 
 const payload = {
-original_file_content: fileContent,
+session,
+quiz_id: quizId,
 quiz_name: file?.name || "Unknown Quiz",
 time_spent: timeSpent,
 questions: questions.map((q) => ({
+id: q.id,
 question: q.question,
 answer: answers[q.question] || "",
 })),
@@ -154,6 +154,16 @@ className="btn btn-primary"
 {isLoading ? <Spinner label="Loading" size="sm" /> : "Start Quiz"}
 </button>
 </div>
+{username && (
+<label className="weak-toggle">
+<input
+type="checkbox"
+checked={weakOnly}
+onChange={(e) => setWeakOnly(e.target.checked)}
+/>
+{" "}Focus on the questions I miss most
+</label>
+)}
     {error && (
       <div className="error-message">
         <strong>❌ Error:</strong>